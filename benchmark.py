@@ -0,0 +1,154 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+import numpy as np
+import pyximport; pyximport.install()
+
+import policies
+from cms import CMS
+from hierarchical import HierarchicalCache
+from levelpolicies import LLRU, LClock, LSLRU, LWTinyLFU
+from parsers import LirsParser
+from simplepolicies import LRU, LFU, ArrayLRU
+from wtinylfu import WTinyLFU, WC_WTinyLFU, WI_WTinyLFU
+
+# Replays sample_trace.tr and seeded synthetic Zipf traces through the policies and reports their throughput.
+# Every benchmark runs --warmup untimed times and then --repeat timed times; the median requests/second is
+# compared with the baseline file, and a drop beyond --threshold is reported as a regression (exit status 1).
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-t', '--trace', action='store', default='sample_trace.tr')
+parser.add_argument('-n', '--requests', action='store', type=int, default=100000) # requests replayed per trace, 0 for the whole trace
+parser.add_argument('-z', '--zipf', action='store', default='0.8,1.2') # comma separated skews of the synthetic traces
+parser.add_argument('-k', '--keys', action='store', type=int, default=100000) # distinct keys of the synthetic traces
+parser.add_argument('-e', '--seed', action='store', type=int, default=1)
+parser.add_argument('-c', '--cachesize', action='store', type=int, default=10000)
+parser.add_argument('-w', '--warmup', action='store', type=int, default=1)
+parser.add_argument('-r', '--repeat', action='store', type=int, default=5)
+parser.add_argument('-f', '--filter', action='store', default='') # comma separated benchmark names, empty for all
+parser.add_argument('-b', '--baseline', action='store', default='benchmark_baseline.json')
+parser.add_argument('-s', '--save', action='store', type=bool, default=False) # store this run as the new baseline
+parser.add_argument('-x', '--threshold', action='store', type=float, default=0.10) # tolerated throughput drop
+parser.add_argument('-o', '--outfile', action='store', default='benchmark_results.json')
+args = parser.parse_args()
+
+
+def replay_many(policy, keys):
+    policy.record_many(keys)
+
+
+# policies.py has no batched entry point
+def replay_each(policy, keys):
+    record = policy.record
+    for key in keys.tolist():
+        record(key)
+
+
+def replay_cms(cms, keys):
+    cms.increment_many(keys)
+    cms.frequency_many(keys)
+
+
+# ArrayLRU allocates its slot arrays in reset()
+def array_lru(size):
+    policy = ArrayLRU(size)
+    policy.reset()
+    return policy
+
+
+# name: (construction from the cache size, replay of the keys), only the replay is timed
+benchmarks = {'LRU': (LRU, replay_many),
+              'ArrayLRU': (array_lru, replay_many),
+              'LFU': (LFU, replay_many),
+              'LLRU': (LLRU, replay_many),
+              'LClock': (LClock, replay_many),
+              'LSLRU': (LSLRU, replay_many),
+              'LWTinyLFU': (LWTinyLFU, replay_many),
+              'HierarchicalCache': (lambda size: HierarchicalCache(max(1, size // 10), size - size // 10), replay_many),
+              'WTinyLFU': (WTinyLFU, replay_many),
+              'WC_WTinyLFU': (WC_WTinyLFU, replay_many),
+              'WI_WTinyLFU': (WI_WTinyLFU, replay_many),
+              'policies.WTinyLFU': (policies.WTinyLFU, replay_each),
+              'policies.WC_WTinyLFU': (policies.WC_WTinyLFU, replay_each),
+              'policies.WI_WTinyLFU': (policies.WI_WTinyLFU, replay_each),
+              'CMS': (CMS, replay_cms)}
+
+
+def load_trace(trace_file, requests):
+    keys = np.concatenate(list(LirsParser(trace_file).chunks(1 << 16)))
+    return keys[:requests] if requests > 0 else keys
+
+
+# Popularity ranks drawn from a bounded Zipf distribution, mapped to keys by a seeded permutation
+def zipf_trace(skew, keys, requests, seed):
+    rng = np.random.default_rng(seed)
+    weights = 1.0 / np.arange(1, keys + 1) ** skew
+    ranks = rng.choice(keys, size=requests, p=weights / weights.sum())
+    return rng.permutation(keys).astype(np.int64)[ranks]
+
+
+def measure(benchmark, keys, size):
+    construct, replay = benchmark
+    for _ in range(args.warmup):
+        replay(construct(size), keys)
+    throughputs = []
+    for _ in range(args.repeat):
+        policy = construct(size)
+        start = time.perf_counter()
+        replay(policy, keys)
+        throughputs.append(len(keys) / (time.perf_counter() - start))
+    return {'median': statistics.median(throughputs),
+            'mean': statistics.mean(throughputs),
+            'stdev': statistics.stdev(throughputs) if len(throughputs) > 1 else 0.0,
+            'min': min(throughputs),
+            'max': max(throughputs),
+            'requests': len(keys)}
+
+
+def main():
+    requests = args.requests if args.requests > 0 else 0
+    traces = {os.path.basename(args.trace): load_trace(args.trace, requests)}
+    for skew in args.zipf.split(','):
+        if skew:
+            traces["zipf_{}".format(skew)] = zipf_trace(float(skew), args.keys, requests or len(traces[os.path.basename(args.trace)]), args.seed)
+    names = [name for name in benchmarks if not args.filter or name in args.filter.split(',')]
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+    results = {}
+    regressions = []
+    print("{:<22} {:<18} {:>12} {:>8} {:>10}".format('Benchmark', 'Trace', 'Median r/s', 'Stdev%', 'vs Base'))
+    for name in names:
+        for trace, keys in traces.items():
+            result = measure(benchmarks[name], keys, args.cachesize)
+            entry = "{}|{}".format(name, trace)
+            results[entry] = result
+            change = ""
+            if entry in baseline:
+                ratio = result['median'] / baseline[entry]['median'] - 1
+                change = "{:+.1%}".format(ratio)
+                if ratio < -args.threshold:
+                    change += " REGRESSION"
+                    regressions.append(entry)
+            print("{:<22} {:<18} {:>12.0f} {:>8.1%} {:>10}".format(name, trace, result['median'], result['stdev'] / result['median'], change))
+    report = {'meta': {'python': platform.python_version(), 'platform': platform.platform(), 'numpy': np.__version__,
+                       'cachesize': args.cachesize, 'warmup': args.warmup, 'repeat': args.repeat, 'seed': args.seed, 'time': time.time()},
+              'results': results}
+    with open(args.outfile, 'w') as f:
+        json.dump(report, f, indent=1, sort_keys=True)
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=1, sort_keys=True)
+    if regressions:
+        print("{} regression(s) beyond {:.0%}: {}".format(len(regressions), args.threshold, ", ".join(regressions)))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
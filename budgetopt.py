@@ -1,11 +1,14 @@
 import csv
 import argparse
 import os
+from graphs import FigureRenderer
 import matplotlib.pyplot as plt
 import math
 import sys
+from bisect import bisect_right
 from matplotlib import cm
 import numpy as np
+from resultsdb import ResultsDB, MULTI_TABLE
 
 
 parser = argparse.ArgumentParser()
@@ -15,15 +18,24 @@ parser.add_argument('-o', '--outdir', action='store', default='.\\graphs\\budget
 parser.add_argument('-r', '--ramcost', action='store', type=int, default=2300) # in cents/GB/month
 parser.add_argument('-s', '--ssdcost', action='store', type=int, default=260) # in cents/GB/month
 parser.add_argument('-u', '--unitsize', action='store', type=int, default=1024) # minimal size of an item in Bytes
+parser.add_argument('-z', '--sized', action='store', type=bool, default=False) # sizes in the input are Bytes (cacheck --sized)
+parser.add_argument('-W', '--writes', action='store', type=bool, default=False) # with --database, the rows of write-aware replays (cacheck --writes)
+parser.add_argument('-D', '--database', action='store', default='') # read the results from this SQLite database instead of --infile
+parser.add_argument('-P', '--policy', action='store', default='HierarchicalCache') # multilevel policy whose rows are used
+parser.add_argument('-b', '--budgetstep', action='store', type=float, default=100) # budget resolution in cents/month
+parser.add_argument('-f', '--frontier', action='store', type=bool, default=False) # also write the whole cost/latency frontier of every trace and storage
+parser.add_argument('-j', '--jobs', action='store', type=int, default=0) # worker processes rendering the figures, 0 for one per CPU
+parser.add_argument('-F', '--force', action='store', type=bool, default=False) # render every figure, even when its data did not change
 parser.add_argument('-v', '--verbose', action='store', type=bool, default=False)
 
 args = parser.parse_args()
 
 cost_size = 1024*1024*1024 # 1 GB
+unit_size = 1 if args.sized else args.unitsize
 storage_technologies = ["FastDB","ModDB","SlowDB"]
 
 
-def plot_budgets(trace,storage,best_budgets,best_l1s,best_l2s,best_latencies):
+def plot_budgets(path,title,best_budgets,best_l1s,best_l2s,best_latencies):
     best_l1s = np.array(best_l1s)
     best_l2s = np.array(best_l2s)
     best_budgets = np.array(best_budgets)
@@ -48,8 +60,8 @@ def plot_budgets(trace,storage,best_budgets,best_l1s,best_l2s,best_latencies):
     p = axs[2].plot(best_budgets, best_latencies)
     axs[2].set_ylabel("Latency (ms)")
     plt.xlabel("Budget ($/Month)")
-    axs[0].set_title(trace.split(".txt")[0] + ":" + storage + ":" + str(args.ramcost) + ":" + str(args.ssdcost) + ":" + str(args.unitsize))
-    plt.savefig(os.path.join(args.outdir, trace.split(".txt")[0] + "_" + storage + "_" + str(args.ramcost) + "_" + str(args.ssdcost) + "_" + str(args.unitsize) + ".png"), bbox_inches='tight')
+    axs[0].set_title(title)
+    plt.savefig(path, bbox_inches='tight')
     plt.close()
 
 
@@ -58,7 +70,9 @@ def parse_input():
     with open(os.path.join(args.indir,args.infile), mode ='r') as file:
         dictResults = csv.DictReader(file)
         for row in dictResults:
-            trace = str(row['Trace']).split()
+            if row['Policy'].strip() != args.policy:
+                continue
+            trace = str(row['Trace']).strip()
             if trace not in results:
                 results[trace] = {}
             L1_size = int(row['L1_Size'])
@@ -66,7 +80,7 @@ def parse_input():
             for storage in storage_technologies:
                 if storage not in results[trace]:
                     results[trace][storage] = {}
-                budget = round((L1_size * args.ramcost + L2_size * args.ssdcost) * args.unitsize / cost_size,2)
+                budget = round((L1_size * args.ramcost + L2_size * args.ssdcost) * unit_size / cost_size,2)
                 if args.verbose:
                     print("L1_size:" + str(L1_size) + " L2_size:" + str(L2_size) + " Budget:" + str(budget))
                 weighted = " Weighted" + storage
@@ -81,54 +95,83 @@ def parse_input():
     return results
 
 
-def find_fastest(budget_limit, max_i, prev_i, budgets, results):
-    if args.verbose:
-        print("find_fastest:"+str(budget_limit)+":"+str(max_i)+":"+str(prev_i)+":"+str(len(budgets)))
-    min_latency = sys.maxsize
-    best_l1 = 0
-    best_l2 = 0
-    best_budget = 0
-    for i in range(prev_i,max_i,1):
-        for l1_size,l2_size,latency in results[budgets[i]]:
-            if latency < min_latency:
-                min_latency = latency
-                best_l1 = l1_size
-                best_l2 = l2_size
-                best_budget = budgets[i]
+def parse_database():
+    results = {}
+    db = ResultsDB(args.database)
+    for trace in db.traces(MULTI_TABLE):
+        for storage in storage_technologies:
+            for row in db.query("SELECT l1_size, l2_size, Weighted{} AS latency FROM {} WHERE trace = ? AND policy = ? AND writes = ?".format(storage, MULTI_TABLE), (trace, args.policy, int(args.writes))):
+                budget = round((row['l1_size'] * args.ramcost + row['l2_size'] * args.ssdcost) * unit_size / cost_size,2)
+                results.setdefault(trace, {}).setdefault(storage, {}).setdefault(budget, []).append((row['l1_size'], row['l2_size'], row['latency']))
+    db.close()
+    return results
+
+
+# Configurations sorted by budget, keeping only those faster than every cheaper one, so the fastest
+# configuration within any budget is the last frontier point whose budget does not exceed it
+def pareto_frontier(results):
+    frontier = []
+    for budget in sorted(results):
+        l1_size, l2_size, latency = min(results[budget], key=lambda result: result[2])
+        if not frontier or latency < frontier[-1][3]:
+            frontier.append((budget, l1_size, l2_size, latency))
+    return frontier
+
+
+# Returns (budget, l1, l2, latency) of the fastest configuration within budget_limit, or the whole frontier without a limit
+def find_fastest(frontier, budget_limit=None):
+    if budget_limit is None:
+        return frontier
+    i = bisect_right(frontier, budget_limit, key=lambda point: point[0]) - 1
+    if i < 0:
+        return (0, 0, 0, sys.maxsize)
     if args.verbose:
-        print("found:"+str(best_budget)+":"+str(best_l1)+":"+str(best_l2)+":"+str(min_latency))
-    return (best_budget,best_l1,best_l2,min_latency)
+        print("found:"+str(budget_limit)+":"+str(frontier[i]))
+    return frontier[i]
+
 
+def write_frontier(trace, storage, frontier):
+    with open(os.path.join(args.outdir, trace.split(".txt")[0] + "_" + storage + "_frontier.csv"), mode='w') as f:
+        f.write("Budget,L1_Size,L2_Size,Latency\n")
+        for budget, l1_size, l2_size, latency in find_fastest(frontier):
+            f.write("{},{},{},{}\n".format(budget, l1_size, l2_size, latency))
 
-def process_input(results):
+
+def process_input(results, renderer):
     for trace in results.keys():
         for storage in results[trace]:
             best_budgets = []
             best_l1s = []
             best_l2s = []
             best_latencies = []
-            budgets = list(results[trace][storage].keys())
-            budgets.sort()
-            budget_steps = range(max(100,math.ceil(budgets[0])), args.ramcost+1, 100) #range(math.ceil(budgets[0]), args.ramcost+1, 20)
-            max_i = 0
-            prev_i = 0
+            frontier = pareto_frontier(results[trace][storage])
+            if args.frontier:
+                write_frontier(trace, storage, frontier)
+            budget_steps = np.arange(max(100,math.ceil(frontier[0][0])), args.ramcost + args.budgetstep / 2, args.budgetstep)
             for budget_limit in budget_steps:
-                while max_i < len(budgets) and budgets[max_i] <= budget_limit:
-                    max_i += 1
-                if prev_i < len(budgets):
-                    best_budget,best_l1,best_l2,best_latency = find_fastest(budget_limit,max_i,prev_i,budgets,results[trace][storage])
-                    if best_budget > 0:
-                        best_budgets.append(best_budget)
-                        best_l1s.append(best_l1)
-                        best_l2s.append(best_l2)
-                        best_latencies.append(best_latency)
-                prev_i = max_i
-            plot_budgets(trace,storage,best_budgets,best_l1s,best_l2s,best_latencies)
+                best_budget,best_l1,best_l2,best_latency = find_fastest(frontier, budget_limit)
+                if best_budget > 0 and (not best_budgets or best_budget != best_budgets[-1]):
+                    best_budgets.append(best_budget)
+                    best_l1s.append(best_l1)
+                    best_l2s.append(best_l2)
+                    best_latencies.append(best_latency)
+            renderer.submit(plot_budgets, os.path.join(args.outdir, trace.split(".txt")[0] + "_" + storage + "_" + str(args.ramcost) + "_" + str(args.ssdcost) + "_" + str(args.unitsize) + ".png"),
+                            trace.split(".txt")[0] + ":" + storage + ":" + str(args.ramcost) + ":" + str(args.ssdcost) + ":" + str(args.unitsize),
+                            best_budgets, best_l1s, best_l2s, best_latencies)
 
 
+#        for storage in ["FastDB","ModDB","SlowDB"]:
+#            multiplot_storage("Weighted"+storage,traceresults,X,Y)
 
-results = parse_input()
-process_input(results)
 
-#        for storage in ["FastDB","ModDB","SlowDB"]:
-#            multiplot_storage("Weighted"+storage,traceresults,X,Y)
\ No newline at end of file
+def main():
+    results = parse_database() if args.database else parse_input()
+    renderer = FigureRenderer(args.jobs, args.force)
+    process_input(results, renderer)
+    rendered, skipped = renderer.close()
+    if args.verbose:
+        print("rendered:", rendered, "unchanged:", skipped)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,21 +3,29 @@ import argparse
 import os
 import numpy as np
 from scipy.interpolate import BSpline, CubicSpline
+from graphs import FigureRenderer
 import matplotlib.pyplot as plt
 import math
+from resultsdb import ResultsDB, SINGLE_TABLE, MULTI_TABLE
 
 parser = argparse.ArgumentParser()
 parser.add_argument('-s', '--singlefile', action='store', default='single_budgeted.csv')
 parser.add_argument('-m', '--multifile', action='store', default='multi_budgeted.csv')
 parser.add_argument('-d', '--indir', action='store', default='.')
 parser.add_argument('-p', '--outpath', action='store', default='.\\graphs\\budgeted')
+parser.add_argument('-P', '--policy', action='store', default='HierarchicalCache') # multilevel policy whose rows are used
+parser.add_argument('-W', '--writes', action='store', type=bool, default=False) # with --database, the rows of write-aware replays (cacheck --writes)
+parser.add_argument('-D', '--database', action='store', default='') # read the results from this SQLite database instead of the CSV files
 parser.add_argument('-u', '--unitsize', action='store', type=int, default=1024) # minimal size of an item in Bytes
+parser.add_argument('-z', '--sized', action='store', type=bool, default=False) # sizes in the input are Bytes (cacheck --sized)
+parser.add_argument('-j', '--jobs', action='store', type=int, default=0) # worker processes rendering the figures, 0 for one per CPU
+parser.add_argument('-F', '--force', action='store', type=bool, default=False) # render every figure, even when its data did not change
 parser.add_argument('-v', '--verbose', action='store', type=bool, default=False)
 
 args = parser.parse_args()
 
 cost_size = 1024*1024*1024 # 1 GB
-units_per_cost = cost_size / args.unitsize
+units_per_cost = cost_size / (1 if args.sized else args.unitsize)
 storage_technologies = ["FastDB", "ModDB", "SlowDB"]
 
 redis_managed_costs = { 0.05: 260,
@@ -56,6 +64,8 @@ def parse_multi_input():
     with open(os.path.join(args.indir,args.multifile), mode ='r') as file:
         dictResults = csv.DictReader(file)
         for row in dictResults:
+            if row['Policy'].strip() != args.policy:
+                continue
             trace = str(row['Trace'].split(".txt")[0]).strip()
             if trace not in results:
                 results[trace] = {}
@@ -69,16 +79,28 @@ def parse_multi_input():
     return results
 
 
-def trace_plot(trace,single,multi,storage):
-    divider = np.full(len(budgets_of_interest),100)
-    scaled_budgets_of_interest = budgets_of_interest / divider
-    plt.figure()
-    plt.rc('xtick', labelsize=18)
-    plt.rc('ytick', labelsize=18)
+# Only the slices that are plotted: LRU for the single level, every split of --policy for the multilevel
+def parse_database():
+    single_results = {}
+    multi_results = {}
+    db = ResultsDB(args.database)
+    for row in db.query("SELECT trace, policy, size, FastDBDRAM, ModDBDRAM, SlowDBDRAM FROM {} WHERE policy = 'LRU'".format(SINGLE_TABLE)):
+        trace = row['trace'].split(".txt")[0]
+        sizes = single_results.setdefault(trace, {}).setdefault(row['policy'], {})
+        sizes[row['size']] = {storage: int(row[storage + "DRAM"]) for storage in storage_technologies}
+    for row in db.query("SELECT trace, l1_size, l2_size, WeightedFastDB, WeightedModDB, WeightedSlowDB FROM {} WHERE policy = ? AND writes = ?".format(MULTI_TABLE), (args.policy, int(args.writes))):
+        trace = row['trace'].split(".txt")[0]
+        multi_results.setdefault(trace, {})[(row['l1_size'], row['l2_size'])] = {storage: int(row["Weighted" + storage]) for storage in storage_technologies}
+    db.close()
+    return single_results, multi_results
+
+
+def trace_curves(single,multi,storage):
+    curves = []
     sizes = budgets_of_interest * units_per_cost / redis_managed_costs[1.00]
     sizes = list(map(lambda size: round(size),sizes))
     latencies = list(map(lambda size: single[size][storage],sizes))
-    plt.plot(scaled_budgets_of_interest, latencies, label='100%')
+    curves.append(('100%', latencies))
     for ratio in redis_managed_costs.keys():
         if ratio < 0.3:
             total_sizes = budgets_of_interest * units_per_cost / redis_managed_costs[ratio]
@@ -94,7 +116,18 @@ def trace_plot(trace,single,multi,storage):
             size_pairs = list(zip(l1_sizes, l2_sizes))
             print("trace_plot_2:", total_sizes, l1_sizes, l2_sizes)
             latencies = list(map(lambda size_pair: multi[size_pair][storage],size_pairs))
-            plt.plot(scaled_budgets_of_interest, latencies, label=str(ratio * 100)+'%')
+            curves.append((str(ratio * 100)+'%', latencies))
+    return curves
+
+
+def trace_plot(path,title,curves):
+    divider = np.full(len(budgets_of_interest),100)
+    scaled_budgets_of_interest = budgets_of_interest / divider
+    plt.figure()
+    plt.rc('xtick', labelsize=18)
+    plt.rc('ytick', labelsize=18)
+    for label, latencies in curves:
+        plt.plot(scaled_budgets_of_interest, latencies, label=label)
     #plt.xlim(min(budgets_of_interest), max(budgets_of_interest))
     #plt.ylim(min(latencies), max(latencies))
     plt.ylim(ymin=0)
@@ -102,13 +135,26 @@ def trace_plot(trace,single,multi,storage):
     plt.xlabel('Budget ($ per month)',fontsize=20)
     plt.ylabel('Simulated Access Time (ms)', fontsize=20)
     plt.legend()
-    plt.title(trace+":"+storage+":managed")
-    plt.savefig(os.path.join(args.outpath,trace+"-"+storage+".png"), bbox_inches='tight')
+    plt.title(title)
+    plt.savefig(path, bbox_inches='tight')
     plt.close('all')
 
 
-single_results = parse_single_input()
-multi_results = parse_multi_input()
-for trace in single_results:
-    for storage in storage_technologies:
-        trace_plot(trace,single_results[trace]['LRU'],multi_results[trace],storage)
+def main():
+    if args.database:
+        single_results, multi_results = parse_database()
+    else:
+        single_results = parse_single_input()
+        multi_results = parse_multi_input()
+    renderer = FigureRenderer(args.jobs, args.force)
+    for trace in single_results:
+        for storage in storage_technologies:
+            renderer.submit(trace_plot, os.path.join(args.outpath,trace+"-"+storage+".png"), trace+":"+storage+":managed",
+                            trace_curves(single_results[trace]['LRU'],multi_results[trace],storage))
+    rendered, skipped = renderer.close()
+    if args.verbose:
+        print("rendered:", rendered, "unchanged:", skipped)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,25 @@
+import hashlib
+import json
 import os.path
 import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
 
 import numpy as np
 
-#from simplepolicies import LRU , WTinyLFU, AdaptiveWTinyLFU, WC_WTinyLFU, WI_WTinyLFU
-from simplepolicies import LRU,LFU
+import pyximport; pyximport.install()
+from simplepolicies import LRU,LFU,ArrayLRU,BucketLFU
+from wtinylfu import WTinyLFU, WC_WTinyLFU, WI_WTinyLFU
 from hierarchical import HierarchicalCache
-from parsers import LirsParser,RedisParser
+from levelpolicies import LLRU, LClock, LSLRU, LWTinyLFU
+from opt import BeladyMIN, HierarchicalOPT, next_use, trace_keys
+from parsers import LirsParser,RedisParser,RedisOpParser,SizedParser
+from tracecache import TraceCache
+from stackdistance import StackDistance, SplitStackDistance
+from profiling import RunProfile
+from timeseries import WindowedCounters, SINGLE_COUNTERS, SINGLE_BYTE_COUNTERS, MULTI_COUNTERS, MULTI_BYTE_COUNTERS
+from resultsdb import ResultsDB, SINGLE_TABLE, MULTI_TABLE
+from shards import FixedRateSampler, FixedSizeSampler
 import glob
 from costmodel import CostModel
 import argparse
@@ -17,16 +30,34 @@ import math
 parser = argparse.ArgumentParser()
 parser.add_argument('-o', '--outfile', action='store', default='results.csv')
 parser.add_argument('-p', '--path', action='store', default='graphs')
-parser.add_argument('-t', '--tracesdir', action='store', default='C:\\Users\\user\\PycharmProjects\\TraceGenerator\\zipf_traces\\')
+parser.add_argument('-t', '--tracesdir', action='store', default='zipf_traces') # generated by tracegen.py
 parser.add_argument('-r', '--redis', action='store', type=bool, default=False)
+parser.add_argument('-W', '--writes', action='store', type=bool, default=False) # with --redis --multilayer, replay write commands as dirty writes that are written back
 parser.add_argument('-a', '--append', action='store', type=bool, default=False)
+parser.add_argument('-R', '--resume', action='store', type=bool, default=False) # append, skipping configurations already in the output
 parser.add_argument('-m', '--multilayer', action='store', type=bool, default=False)
 parser.add_argument('-b', '--budgeted', action='store', type=bool, default=False)
 parser.add_argument('-u', '--unitsize', action='store', type=int, default=1024) # minimal size of an item in Bytes
+parser.add_argument('-z', '--sized', action='store', type=bool, default=False) # (key, size) traces, capacities and budgets in Bytes
+parser.add_argument('-s', '--stackdist', action='store', type=bool, default=False) # all LRU sizes (or L1/L2 splits with --multilayer) from one stack-distance pass
+parser.add_argument('-P', '--policies', action='store', default='LRU,LFU') # comma separated single-level policies of the default sweep
+parser.add_argument('-M', '--multipolicies', action='store', default='HierarchicalCache') # comma separated two-level policies of the --multilayer sweep
+parser.add_argument('-L', '--levelpolicies', action='store', default='LLRU/LLRU') # comma separated L1/L2 level policy pairs of HierarchicalCache
+parser.add_argument('-k', '--chunksize', action='store', type=int, default=65536) # requests handed to a policy per record_many call
+parser.add_argument('-j', '--jobs', action='store', type=int, default=1) # number of worker processes for the sweep
+parser.add_argument('--shardsrate', action='store', type=float, default=0.0) # SHARDS: simulate only keys hashed below this rate
+parser.add_argument('--shardssize', action='store', type=int, default=0) # SHARDS: sample at most this many keys per trace
+parser.add_argument('--profile', action='store', type=bool, default=False) # throughput, peak RSS and allocations per row in <outfile>.profile.csv
+parser.add_argument('--profileperiod', action='store', type=int, default=0) # with --profile, time one of every N calls of the record/evict/try_access/victim paths
+parser.add_argument('--profiledir', action='store', default='') # with --profile, dump cProfile stats of every row here
+parser.add_argument('-w', '--window', action='store', type=int, default=0) # hits, misses and level breakdowns of every N requests per row in <outfile>.series.csv
+parser.add_argument('-D', '--database', action='store', default='') # also store the results in this SQLite database
+parser.add_argument('-d', '--dense', action='store', type=bool, default=False) # replay dense key ids from the trace cache, array-indexed policies skip hashing the keys
+parser.add_argument('-c', '--cachedir', action='store', default='.tracecache') # parsed traces are kept here, empty to always re-parse
 args = parser.parse_args()
 
 cost_size = 1024*1024*1024 # 1 GB
-units_per_cost = cost_size / args.unitsize
+units_per_cost = cost_size / (1 if args.sized else args.unitsize) # sized traces carry their own item sizes
 cache_technologies = [CostModel("DRAM",0.5), CostModel("SSD", 3)]
 # storage_technologies = [CostModel("Dynamodb", 10), CostModel("Mongodb", 50), CostModel("SQL", 100)]
 storage_technologies = [CostModel("FastDB", 10), CostModel("ModDB", 50), CostModel("SlowDB", 100)]
@@ -41,16 +72,178 @@ redis_managed_costs = { 0.05: 260,
                         }
 budgets_of_interest = np.array([100, 200, 300, 400, 600, 600, 700, 800, 900, 1000])
 
+single_level_policies = {'LRU': LRU, 'LFU': LFU, 'ArrayLRU': ArrayLRU, 'BucketLFU': BucketLFU,
+                         'WTinyLFU': WTinyLFU, 'WC_WTinyLFU': WC_WTinyLFU, 'WI_WTinyLFU': WI_WTinyLFU, 'BeladyMIN': BeladyMIN}
+multi_level_policies = {'HierarchicalCache': HierarchicalCache, 'HierarchicalOPT': HierarchicalOPT}
+level_policies = {'LLRU': LLRU, 'LClock': LClock, 'LSLRU': LSLRU, 'LWTinyLFU': LWTinyLFU}
+
+# policies that evict by byte capacity, the others assume unit-sized items or allocate per unit of capacity
+size_aware_policies = ['LRU', 'LFU', 'BucketLFU']
+size_aware_level_policies = ['LLRU', 'LClock', 'LSLRU']
+
 aggresults = {}
+trace_cache = TraceCache(args.cachedir)
+results_db = None
+
+
+# The next-use index of the offline policies (opt.py), computed once per trace (and sampler) in each process and
+# shared by all its configurations. Only the last trace's is kept.
+offline_index = {}
 
 
-def run(trace, policy):
+def offline_next_uses(trace_id, trace):
+    if trace_id not in offline_index:
+        offline_index.clear()
+        offline_index[trace_id] = next_use(trace_keys(trace))
+    return offline_index[trace_id]
+
+
+# trace_id identifies the replayed trace (file and sampler) for offline_next_uses
+def run(trace, policy, profile=None, series=None, trace_id=None):
     policy.reset()
-    for item in trace:
-        policy.record(item)
+    if getattr(trace, 'distinct', None) is not None:
+        policy.use_dense_keys(trace.unique_keys)
+    if hasattr(policy, 'prepare'): # offline policies (opt.py) see the whole trace first
+        policy.prepare(next_use(trace_keys(trace)) if trace_id is None else offline_next_uses(trace_id, trace))
+    record_many = policy.record_many if profile is None else profile.start(policy)
+    chunks = trace.chunks(args.chunksize)
+    if series is not None:
+        chunks = series.windows(chunks, policy)
+    for chunk in chunks:
+        if chunk.ndim == 1:
+            record_many(chunk)
+        elif chunk.shape[1] == 2:
+            record_many(chunk[:, 0], chunk[:, 1])
+        else:
+            record_many(chunk[:, 0], chunk[:, 1], chunk[:, 2])
+    if profile is not None:
+        profile.stop()
+    if series is not None:
+        series.finish(policy)
+    if hasattr(policy, 'prepare'): # the policies of a serial sweep are kept, but not their index
+        policy.prepare(None)
     return policy.get_stats()
 
 
+# With SHARDS the windows count sampled requests and the counters are not unscaled
+def make_series():
+    if args.multilayer:
+        return WindowedCounters(args.window, MULTI_COUNTERS + (MULTI_BYTE_COUNTERS if args.sized else []))
+    return WindowedCounters(args.window, SINGLE_COUNTERS + (SINGLE_BYTE_COUNTERS if args.sized else []))
+
+
+def simulate(tracefile, policy, sampler=None):
+    start = time.time()
+    profile = None
+    if args.profile:
+        dump_path = None
+        if args.profiledir:
+            os.makedirs(args.profiledir, exist_ok=True)
+            dump_path = os.path.join(args.profiledir, "{}.{}.{}.pstats".format(os.path.basename(tracefile), policy.get_name(), profile_size(policy)))
+        profile = RunProfile(args.profileperiod, dump_path)
+    series = make_series() if args.window > 0 else None
+    if sampler is None:
+        results = run(open_trace(tracefile), policy, profile, series, (tracefile, None))
+    else:
+        results = sampler.unscale(run(sampler.sample(open_trace(tracefile)), sampler.scale(policy), profile, series, (tracefile, sampler.get_name())), policy)
+    if profile is not None:
+        results['profile'] = profile.get_stats()
+    if series is not None:
+        results['series'] = series.get_series()
+    return results, time.time() - start
+
+
+def profile_size(policy):
+    return "-".join(str(value) for value in policy.get_params().values())
+
+
+def write_profile(f, tracefile, policy, profile):
+    paths = ";".join("{}={}".format(path, ns) for path, ns in sorted(profile['paths'].items()))
+    f.write("{},{},{},{requests},{requests/s},{ns/request},{peak rss kb},{allocated blocks},{gc collections},{}\n".format(
+        os.path.basename(tracefile), policy.get_name(), profile_size(policy), paths, **profile))
+    f.flush()
+
+
+def series_header():
+    columns = make_series().get_columns()
+    return ",".join(['Trace', 'Policy', 'Size', 'Window'] + ["_".join(word.capitalize() for word in column.replace(' ', '_').split('_')) for column in columns] + ['Hit_Ratio']) + "\n"
+
+
+# The first two counters are the hits and misses of the window
+def write_series(f, tracefile, policy, series):
+    for window, row in enumerate(series):
+        f.write("{},{},{},{},{},{:.6f}\n".format(os.path.basename(tracefile), policy.get_name(), profile_size(policy), window,
+                                               ",".join(str(value) if value >= 0 else "" for value in row), row[1] / max(1, row[1] + row[2])))
+    f.flush()
+
+
+def simulate_lru_curve(tracefile, sizes, sampler=None):
+    start = time.time()
+    if sampler is None:
+        lru_curve = StackDistance(open_trace(tracefile))
+    else:
+        lru_curve = StackDistance(sampler.sample(open_trace(tracefile)))
+    elapsed = (time.time() - start) / max(1, len(sizes)) # the single pass is charged evenly to the LRU rows it replaces
+    if sampler is None:
+        return {size: (lru_curve.lru_stats(size), elapsed) for size in sizes}
+    return {size: (sampler.unscale(lru_curve.lru_stats(sampler.scale_size(size)), LRU(size)), elapsed) for size in sizes}
+
+
+def simulate_split_curve(tracefile, splits, sampler=None):
+    start = time.time()
+    if sampler is None:
+        split_curve = SplitStackDistance(open_trace(tracefile), splits)
+    else:
+        split_curve = SplitStackDistance(sampler.sample(open_trace(tracefile)), [(sampler.scale_size(l1_size), sampler.scale_size(l2_size)) for l1_size, l2_size in splits])
+    elapsed = (time.time() - start) / max(1, len(splits))
+    if sampler is None:
+        return {split: (split_curve.split_stats(*split), elapsed) for split in splits}
+    return {split: (sampler.unscale(split_curve.split_stats(sampler.scale_size(split[0]), sampler.scale_size(split[1])), HierarchicalCache(*split)), elapsed) for split in splits}
+
+
+# Configurations answered by a single stack distance pass: LRU sizes, or the L1/L2 splits of HierarchicalCache.
+# Time series and dirty writes need the policy itself to be replayed.
+def curve_key(policy):
+    if args.sized or args.writes or args.window > 0:
+        return None
+    if args.multilayer and type(policy) is HierarchicalCache and policy.is_lru():
+        return (policy.l1_maximum_size, policy.l2_maximum_size)
+    if not args.multilayer and type(policy) is LRU:
+        return policy.maximum_size
+    return None
+
+
+def make_sampler(tracefile):
+    if args.shardssize > 0:
+        sampler = FixedSizeSampler(args.shardssize)
+    elif args.shardsrate > 0:
+        sampler = FixedRateSampler(args.shardsrate)
+    else:
+        return None
+    sampler.prepare(open_trace(tracefile), args.chunksize)
+    return sampler
+
+
+# Without a pool the job runs right away, so the serial sweep keeps writing rows as it goes
+def dispatch(executor, fn, *fnargs):
+    if executor is not None:
+        return executor.submit(fn, *fnargs)
+    future = Future()
+    future.set_result(fn(*fnargs))
+    return future
+
+
+def open_trace(tracefile):
+    parser_class = LirsParser
+    if args.redis:
+        parser_class = RedisOpParser if args.writes else RedisParser
+    if args.sized:
+        parser_class = SizedParser
+    if args.cachedir:
+        return trace_cache.load(tracefile, parser_class, args.dense)
+    return parser_class(tracefile)
+
+
 def add_trace_results(trace):
     if trace not in aggresults:
         aggresults[trace] = {}
@@ -68,24 +261,201 @@ def add_size_results(trace,policy,size,resname,resvalue):
         aggresults[trace][policy][size][resname] = resvalue
 
 
+def write_results(f, tracefile, policy, results, elapsed, resumed=False):
+    add_trace_results(os.path.basename(tracefile))
+    add_policy_results(os.path.basename(tracefile),policy.get_name())
+    row = ""
+    record = {'trace': os.path.basename(tracefile), 'policy': results['name'], 'time': round(elapsed,4)}
+    if args.multilayer:
+        record.update((name, value) for name, value in results.items() if name != 'name')
+        record['writes'] = int(args.writes)
+        row += "{trace:<20}, ".format(trace=os.path.basename(tracefile))
+        row += "{name}, {l1_size}, {l2_size}, {l1_hits}, {l1_misses}, {l1_accesses}, {l1_writes}, {l1_charged}, {l1_hit_ratio}, {l2_hits}, {l2_misses}, {l2_accesses}, {l2_writes}, {l2_charged}, {l2_hit_ratio}, {total_hits}, {total_misses}, {total_accesses}, {remote_accesses}, {remote_writes}, {remote_charged}, {total_hit_ratio}, {time}".format(**results, time=round(elapsed,4))
+        for storage in storage_technologies:
+            weighted = results['l1_charged'] * cache_technologies[0].access_time + results['l2_charged'] * cache_technologies[1].access_time + results['remote_charged'] * storage.access_time
+            row += ", {:12}".format(weighted)
+            record["Weighted" + storage.name] = weighted
+        if args.sized:
+            row += ", {total_byte_hit_ratio}".format(**results)
+        if 'sample_rate' in results:
+            row += ", {sample_rate}, {total_hit_ratio_error}".format(**results)
+    else:
+        add_size_results(os.path.basename(tracefile), policy.get_name(), policy.maximum_size, "hit ratio", results['hit ratio'])
+        record.update(size=results['size'], hits=results['hits'], misses=results['misses'], hit_ratio=results['hit ratio'], byte_hit_ratio=results.get('byte hit ratio'),
+                      sample_rate=results.get('sample rate'), hit_ratio_error=results.get('hit ratio error'))
+        row += "{trace:<20},".format(trace=os.path.basename(tracefile))
+        row += "{name:<12},{size:<12},{hits:<12},{misses:<12},{hit ratio:<12},{time:<12}".format(**results, time=round(elapsed,4))
+        for storage in storage_technologies:
+            for cache in cache_technologies:
+                weighted = results['hits'] * cache.access_time + (results['misses'] * storage.access_time)
+                row += ",{:12}".format(weighted)
+                record[storage.name + cache.name] = weighted
+                add_size_results(os.path.basename(tracefile), policy.get_name(), policy.maximum_size, storage.name+cache.name, weighted)
+        if args.sized:
+            row += ",{byte hit ratio:<12}".format(**results)
+        if 'sample rate' in results:
+            row += ",{sample rate:<12},{hit ratio error:<12}".format(**results)
+    if resumed: # the row is already in the output, only aggresults needs it
+        return
+    f.write(row + "\n")
+    f.flush()
+    if results_db is not None:
+        results_db.insert(MULTI_TABLE if args.multilayer else SINGLE_TABLE, record)
+    print(".", end="")
+
+
+# Identifies a configuration across runs: trace name (rows are labeled by it) and content (its digest, computed
+# once per trace), policy and its parameters, and the sweep settings that change its row
+def fingerprint(tracefile, trace_digest, policy, sampler):
+    config = {'trace': trace_digest,
+              'name': os.path.basename(tracefile),
+              'policy': policy.get_name(),
+              'params': policy.get_params(),
+              'unitsize': args.unitsize,
+              'sized': args.sized,
+              'multilayer': args.multilayer,
+              'sampler': None if sampler is None else sampler.get_name()}
+    if args.writes: # only when set, so that the read-only configurations keep their fingerprints
+        config['writes'] = True
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+
+# Every written row is journaled as {"fingerprint", "results", "elapsed", "ends"} next to the output file, ends
+# being where the output, profile and series files ended once the row was written. Returns the completed
+# configurations, the length of the complete entries and the ends of the last one.
+def load_completed(journal_path):
+    completed = {}
+    journal_end = 0
+    ends = None
+    if os.path.exists(journal_path):
+        with open(journal_path, 'rb') as journal:
+            for line in journal:
+                if not line.endswith(b"\n"): # cut short by a crash
+                    break
+                journal_end += len(line)
+                if line.strip():
+                    entry = json.loads(line)
+                    completed[entry['fingerprint']] = (entry['results'], entry['elapsed'])
+                    ends = entry.get('ends', ends)
+    return completed, journal_end, ends
+
+
+# Rows are written in submission order, so a parallel sweep produces the same file as a serial one
+def write_finished(f, journal, pending, completed, wait, profile_file=None, series_file=None):
+    while pending and (wait or pending[0][2].done()):
+        tracefile, policy, future, curve_size, config = pending.popleft()
+        if curve_size is not None: # a stack-distance curve shared by all LRU sizes or L1/L2 splits
+            results, elapsed = future.result()[curve_size]
+        else:
+            results, elapsed = future.result()
+        resumed = config in completed
+        write_results(f, tracefile, policy, results, elapsed, resumed)
+        if profile_file is not None and not resumed and 'profile' in results:
+            write_profile(profile_file, tracefile, policy, results['profile'])
+        if series_file is not None and not resumed and 'series' in results:
+            write_series(series_file, tracefile, policy, results['series'])
+        if not resumed:
+            ends = [None if output is None else output.tell() for output in (f, profile_file, series_file)]
+            journal.write(json.dumps({'fingerprint': config, 'results': results, 'elapsed': elapsed, 'ends': ends}) + "\n")
+            journal.flush()
+    if results_db is not None:
+        results_db.commit()
+
+
+# The two-level policies of one L1/L2 split: every --multipolicies entry, HierarchicalCache once per --levelpolicies pair
+def multi_level_configurations(l1_size, l2_size):
+    configurations = []
+    for name in args.multipolicies.split(','):
+        if multi_level_policies[name] is HierarchicalCache:
+            for pair in args.levelpolicies.split(','):
+                l1_policy, l2_policy = pair.split('/')
+                configurations.append(HierarchicalCache(l1_size, l2_size, level_policies[l1_policy], level_policies[l2_policy]))
+        else:
+            configurations.append(multi_level_policies[name](l1_size, l2_size))
+    return configurations
+
+
 def main():
+    global results_db
+    if args.dense and not args.cachedir:
+        parser.error("--dense needs the trace cache (--cachedir)")
+    if args.sized and not args.multilayer:
+        for name in args.policies.split(','):
+            if name not in size_aware_policies:
+                parser.error("{} does not support byte capacities, use one of {} with --sized".format(name, ",".join(size_aware_policies)))
+    if args.writes and not (args.redis and args.multilayer and not args.sized):
+        parser.error("--writes replays the commands of redis traces (--redis) through the --multilayer hierarchy, without --sized")
+    if args.writes and 'HierarchicalOPT' in args.multipolicies.split(','):
+        parser.error("HierarchicalOPT does not track dirty items, it cannot replay --writes")
+    for pair in args.levelpolicies.split(','):
+        names = pair.split('/')
+        if len(names) != 2 or any(name not in level_policies for name in names):
+            parser.error("level policies are L1/L2 pairs of {}".format(",".join(level_policies)))
+        if args.sized and args.multilayer and any(name not in size_aware_level_policies for name in names):
+            parser.error("{} does not support byte capacities, use {} with --sized".format(pair, ",".join(size_aware_level_policies)))
+    if args.sized and args.multilayer and 'HierarchicalOPT' in args.multipolicies.split(','):
+        parser.error("HierarchicalOPT does not support byte capacities")
     open_mode = "w"
-    if args.append:
+    if args.append or args.resume:
         open_mode = "a"
+    journal_path = args.outfile + ".done"
+    completed = {}
+    if args.resume:
+        completed, journal_end, ends = load_completed(journal_path)
+        # a crash can leave an incomplete journal entry, and rows written after the last journaled one, which
+        # would be appended again: both are cut off
+        if os.path.exists(journal_path):
+            os.truncate(journal_path, journal_end)
+        if ends is not None:
+            for path, end in zip([args.outfile, args.outfile + ".profile.csv", args.outfile + ".series.csv"], ends):
+                if end is not None and os.path.exists(path) and os.path.getsize(path) > end:
+                    os.truncate(path, end)
+    write_header = not (args.resume and os.path.exists(args.outfile) and os.path.getsize(args.outfile) > 0)
     f = open(args.outfile, open_mode)
+    journal = open(journal_path, open_mode)
+    if args.database:
+        results_db = ResultsDB(args.database,
+                               [storage.name + cache.name for storage in storage_technologies for cache in cache_technologies],
+                               ["Weighted" + storage.name for storage in storage_technologies])
+    profile_file = None
+    if args.profile:
+        profile_path = args.outfile + ".profile.csv"
+        write_profile_header = open_mode == "w" or not os.path.exists(profile_path) or os.path.getsize(profile_path) == 0
+        profile_file = open(profile_path, open_mode)
+        if write_profile_header:
+            profile_file.write("Trace,Policy,Size,Requests,Requests/s,ns/Request,Peak RSS(KB),Net Alloc Blocks,GC Collections,Sampled Paths(ns)\n")
+    series_file = None
+    if args.window > 0:
+        series_path = args.outfile + ".series.csv"
+        write_series_header = open_mode == "w" or not os.path.exists(series_path) or os.path.getsize(series_path) == 0
+        series_file = open(series_path, open_mode)
+        if write_series_header:
+            series_file.write(series_header())
+    header = ""
     if args.multilayer:
-        f.write("Trace,Policy,L1_Size,L2_Size,L1_Hits,L1_Misses,L1_Accesses,L1_Writes,L1_Charged,L1_Hit_Ratio,L2_Hits,L2_Misses,L2_Accesses,L2_Writes,L2_Charged,L2_Hit_Ratio,Total_Hits,Total_Misses,Total_Accesses,Remote_Accesses,Remote_Writes,Remote_Charged,Total_Hit_Ratio,Time(s)")
+        header += ("Trace,Policy,L1_Size,L2_Size,L1_Hits,L1_Misses,L1_Accesses,L1_Writes,L1_Charged,L1_Hit_Ratio,L2_Hits,L2_Misses,L2_Accesses,L2_Writes,L2_Charged,L2_Hit_Ratio,Total_Hits,Total_Misses,Total_Accesses,Remote_Accesses,Remote_Writes,Remote_Charged,Total_Hit_Ratio,Time(s)")
         for storage in storage_technologies:
-            f.write(", Weighted{}".format(storage.name))
+            header += (", Weighted{}".format(storage.name))
+        if args.sized:
+            header += (", Total_Byte_Hit_Ratio")
+        if args.shardsrate > 0 or args.shardssize > 0:
+            header += (", Sample_Rate, Total_Hit_Ratio_Error")
     else:
-        f.write("{:<20},{:<12},{:<12},{:<12},{:<12},{:<12},{:<12}".format('Trace', 'Policy', 'Cache Size', 'Hits', 'Misses', 'Hit Ratio', 'Time(s)'))
+        header += ("{:<20},{:<12},{:<12},{:<12},{:<12},{:<12},{:<12}".format('Trace', 'Policy', 'Cache Size', 'Hits', 'Misses', 'Hit Ratio', 'Time(s)'))
         technologies = []
         for storage in storage_technologies:
             for cache in cache_technologies:
                 technology = storage.name+cache.name
-                f.write(",{:12}".format(technology))
+                header += (",{:12}".format(technology))
                 technologies.append(technology)
-    f.write("\n")
+        if args.sized:
+            header += (",{:<12}".format('Byte HR'))
+        if args.shardsrate > 0 or args.shardssize > 0:
+            header += (",{:<12},{:<12}".format('Sample Rate', 'HR Error'))
+    header += ("\n")
+    if write_header:
+        f.write(header)
+    capacity_unit = args.unitsize if args.sized else 1 # the default grid counts items of unitsize Bytes
     policies = []
     if args.multilayer:
         if args.budgeted:
@@ -93,14 +463,14 @@ def main():
                 for percentage,cost in redis_managed_costs.items():
                     if percentage < 1.00:
                         total_size = math.ceil(budget * units_per_cost/ cost)
-                        policies.append(HierarchicalCache(math.ceil(percentage * total_size), math.ceil((1 - percentage) * total_size)))
+                        policies.extend(multi_level_configurations(math.ceil(percentage * total_size), math.ceil((1 - percentage) * total_size)))
         else:
             for factor in range(3, 7):
                 for i in range(1, 10, 1):
                     if factor < 6 or i < 2:
                         cachesize = i*(10**factor)
                         for percentage in [0.01, 0.05, 0.10, 0.20, 0.30, 0.40, 0.5]:
-                            policies.append(HierarchicalCache(math.ceil(percentage*cachesize), math.ceil((1-percentage)*cachesize)))
+                            policies.extend(multi_level_configurations(math.ceil(percentage*cachesize*capacity_unit), math.ceil((1-percentage)*cachesize*capacity_unit)))
     else:
         if args.budgeted:
             for budget in budgets_of_interest:
@@ -110,8 +480,8 @@ def main():
             for factor in range(3,7):
                 for i in range(1,10,1):
                     if factor < 6 or i < 2:
-                        policies.append(LRU(i*(10**factor)))
-                        policies.append(LFU(i * (10 ** factor)))
+                        for name in args.policies.split(','):
+                            policies.append(single_level_policies[name](i * (10 ** factor) * capacity_unit))
     #tracesfiles = glob.glob("C:\\Users\\user\\PycharmProjects\\TraceGenerator\\zipf_traces\\zipf_[1-1].[0-5]_0.0.tr")
     tracesfiles = []
     if args.redis:
@@ -122,39 +492,41 @@ def main():
             for recency in ["0.5", "1.0"]:
                 recencytrace = trace.replace("0.0",recency)  # BUG: does not work "zipf_0.0_[0-9].[0.9]" traces
                 tracesfiles.append(os.path.join(args.tracesdir, recencytrace + ".tr"))
+    executor = ProcessPoolExecutor(max_workers=args.jobs) if args.jobs > 1 else None
+    pending = deque()
     for tracefile in tracesfiles:
-        add_trace_results(os.path.basename(tracefile))
-        for policy in policies:
-            add_policy_results(os.path.basename(tracefile),policy.get_name())
-            start = time.time()
-            if args.redis:
-                trace = RedisParser(tracefile)
-            else:
-                trace = LirsParser(tracefile)
-            results = run(trace, policy)
-            end = time.time()
-            if args.multilayer:
-                f.write("{trace:<20}, ".format(trace=os.path.basename(tracefile)))
-                f.write("{name}, {l1_size}, {l2_size}, {l1_hits}, {l1_misses}, {l1_accesses}, {l1_writes}, {l1_charged}, {l1_hit_ratio}, {l2_hits}, {l2_misses}, {l2_accesses}, {l2_writes}, {l2_charged}, {l2_hit_ratio}, {total_hits}, {total_misses}, {total_accesses}, {remote_accesses}, {remote_writes}, {remote_charged}, {total_hit_ratio}, {time}".format(**results, time=round(end - start,4)))
-                for storage in storage_technologies:
-                    weighted = results['l1_charged'] * cache_technologies[0].access_time + results['l2_charged'] * cache_technologies[1].access_time + results['remote_charged'] * storage.access_time
-                    f.write(", {:12}".format(weighted))
+        if args.cachedir:
+            open_trace(tracefile) # parse once up front so the first policy's time only covers its replay
+        sampler = make_sampler(tracefile)
+        trace_digest = trace_cache.content_digest(tracefile)
+        configs = [fingerprint(tracefile, trace_digest, policy, sampler) for policy in policies]
+        lru_curve = None
+        if args.stackdist:
+            curve_sizes = [curve_key(policy) for policy, config in zip(policies, configs) if curve_key(policy) is not None and config not in completed]
+            if curve_sizes:
+                lru_curve = dispatch(executor, simulate_split_curve if args.multilayer else simulate_lru_curve, tracefile, curve_sizes, sampler)
+        for policy, config in zip(policies, configs):
+            if config in completed:
+                pending.append((tracefile, policy, dispatch(None, completed.get, config), None, config))
+            elif lru_curve is not None and curve_key(policy) is not None:
+                pending.append((tracefile, policy, lru_curve, curve_key(policy), config))
             else:
-                add_size_results(os.path.basename(tracefile), policy.get_name(), policy.maximum_size, "hit ratio", results['hit ratio'])
-                f.write("{trace:<20},".format(trace=os.path.basename(tracefile)))
-                f.write("{name:<12},{size:<12},{hits:<12},{misses:<12},{hit ratio:<12},{time:<12}".format(**results, time=round(end - start,4)))
-                for storage in storage_technologies:
-                    for cache in cache_technologies:
-                        weighted = results['hits'] * cache.access_time + (results['misses'] * storage.access_time)
-                        f.write(",{:12}".format(weighted))
-                        add_size_results(os.path.basename(tracefile), policy.get_name(), policy.maximum_size, storage.name+cache.name, weighted)
-            f.write("\n")
-            f.flush()
-            print(".", end="")
+                pending.append((tracefile, policy, dispatch(executor, simulate, tracefile, policy, sampler), None, config))
+            write_finished(f, journal, pending, completed, wait=False, profile_file=profile_file, series_file=series_file)
+    write_finished(f, journal, pending, completed, wait=True, profile_file=profile_file, series_file=series_file)
+    if executor is not None:
+        executor.shutdown()
+    journal.close()
+    if results_db is not None:
+        results_db.close()
+    if profile_file is not None:
+        profile_file.close()
+    if series_file is not None:
+        series_file.close()
     f.close()
     print("")
     if not args.multilayer:
-        graphs.generate_all_graphs(".\\graphs",aggresults,technologies)
+        graphs.generate_all_graphs(args.path,aggresults,technologies,args.jobs)
 
 
 if __name__ == "__main__":
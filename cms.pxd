@@ -0,0 +1,13 @@
+cdef class CMS(object):
+    cdef unsigned long* SEED
+    cdef unsigned long* table
+    cdef unsigned int table_mask, step, additions, period
+    cpdef increment(self, unsigned long e)
+    cpdef unsigned int frequency(self, unsigned long e)
+    cdef void add(self, unsigned long e)
+    cdef unsigned int estimate(self, unsigned long e)
+    cdef unsigned int reset(self)
+    cdef unsigned int index_of(self, unsigned int item, unsigned int i)
+    cdef int increment_at(self, unsigned int i, unsigned int j)
+    cdef unsigned int java_long_hash(self, unsigned long key)
+    cdef unsigned int spread(self, unsigned int x, int random_seed=*)
@@ -1,13 +1,23 @@
 from libc.stdlib cimport malloc, free
+from libc.stdint cimport int64_t
+import numpy as np
+
+cdef extern from *:
+    """
+    #if defined(_MSC_VER)
+    #include <intrin.h>
+    #define cms_popcount(x) ((unsigned int)__popcnt64(x))
+    #else
+    #define cms_popcount(x) ((unsigned int)__builtin_popcountll(x))
+    #endif
+    """
+    unsigned int cms_popcount(unsigned long long x) nogil
 
 cdef class CMS(object):
-    cdef unsigned long* SEED
-    cdef unsigned long* table 
-    cdef unsigned int table_mask, step, additions, period
     def __init__(self, maximum_size, step=1):
         self.SEED = <unsigned long*>malloc(4 * sizeof(unsigned long))
         self.SEED[:] = [0xc3a5c85c97cb3127, 0xb492b66fbe98f273, 0x9ae16a3b2f90404f, 0xcbf29ce484222325]
-        next_power_of_two = 2**(len(bin(maximum_size-1))-2)
+        next_power_of_two = 1 << (len(bin(maximum_size-1))-2)
         self.table = <unsigned long*>malloc(next_power_of_two * sizeof(unsigned long))
         for i in range(next_power_of_two):
             self.table[i] = 0
@@ -16,30 +26,61 @@ cdef class CMS(object):
         self.additions = 0
         self.period = 10*next_power_of_two
 
-    def increment(self, unsigned long e):
+    cpdef increment(self, unsigned long e):
+        self.add(e)
+
+    # keys is any int64 buffer (numpy array, memmap slice, ...), the whole loop runs in C
+    def increment_many(self, const int64_t[:] keys):
+        cdef Py_ssize_t i
+        for i in range(keys.shape[0]):
+            self.add(<unsigned long>keys[i])
+
+    cpdef unsigned int frequency(self, unsigned long e):
+        return self.estimate(e)
+
+    # kept for the callers of the original (misspelled) name
+    def frequancy(self, unsigned long e):
+        return self.estimate(e)
+
+    def frequency_many(self, const int64_t[:] keys, out=None):
+        if out is None:
+            out = np.empty(keys.shape[0], dtype=np.int64)
+        cdef int64_t[:] frequencies = out
+        cdef Py_ssize_t i
+        for i in range(keys.shape[0]):
+            frequencies[i] = self.estimate(<unsigned long>keys[i])
+        return out
+
+    cdef void add(self, unsigned long e):
         cdef unsigned int hash_value = self.spread(self.java_long_hash(e))
         cdef unsigned int start = (hash_value & 3) << 2
         cdef unsigned int count
-        added = self.increment_at(self.index_of(hash_value, 0), start    ), \
-                self.increment_at(self.index_of(hash_value, 1), start + 1), \
-                self.increment_at(self.index_of(hash_value, 2), start + 2), \
-                self.increment_at(self.index_of(hash_value, 3), start + 3) 
-        if any(added):
+        cdef int added = 0
+        cdef unsigned int i
+        for i in range(4): # no short-circuit, every row is incremented
+            added |= self.increment_at(self.index_of(hash_value, i), start + i)
+        if added:
             self.additions += self.step
             if self.additions >= self.period:
                 count = self.reset()
                 self.additions = (self.additions >> 1) - (count >> 2)
 
-    def frequancy(self, unsigned long e):
+    cdef unsigned int estimate(self, unsigned long e):
         cdef unsigned int hash_value = self.spread(self.java_long_hash(e))
         cdef unsigned int start = (hash_value & 3) << 2
-        indexes = [self.index_of(hash_value, i) for i in range(4)]
-        return min([((self.table[indexes[i]] >> ((start + i) << 2)) & 0xf) for i in range(4)])
+        cdef unsigned int frequency = 0xf
+        cdef unsigned int count, i
+        for i in range(4):
+            count = (self.table[self.index_of(hash_value, i)] >> ((start + i) << 2)) & 0xf
+            if count < frequency:
+                frequency = count
+        return frequency
 
     cdef unsigned int reset(self):
         cdef unsigned int count = 0
+        cdef unsigned int i
         for i in range(self.table_mask + 1):
-            count += bin(self.table[i] & 0x1111111111111111).count('1')
+            count += cms_popcount(self.table[i] & 0x1111111111111111)
             self.table[i] = (self.table[i] >> 1) & 0x7777777777777777
         return count
 
@@ -74,3 +115,4 @@ cdef class CMS(object):
 
     def __dealloc__(self):
         free(self.table)
+        free(self.SEED)
@@ -2,7 +2,8 @@ import csv
 import argparse
 import os
 import numpy as np
-from scipy.interpolate import BSpline, CubicSpline
+from scipy.interpolate import PchipInterpolator
+from scipy.optimize import minimize_scalar
 import matplotlib.pyplot as plt
 
 parser = argparse.ArgumentParser()
@@ -13,13 +14,19 @@ parser.add_argument('-p', '--outpath', action='store', default='.\\graphs\\proje
 parser.add_argument('-r', '--ramcost', action='store', type=int, default=2300) # in cents/GB/month
 parser.add_argument('-s', '--ssdcost', action='store', type=int, default=260) # in cents/GB/month
 parser.add_argument('-u', '--unitsize', action='store', type=int, default=1024) # minimal size of an item in Bytes
+parser.add_argument('-z', '--sized', action='store', type=bool, default=False) # sizes in the input are Bytes (cacheck --sized)
 parser.add_argument('-v', '--verbose', action='store', type=bool, default=False)
 parser.add_argument('-a', '--accuracy', action='store', type=int, default=4)
 parser.add_argument('-f', '--filter', action='store', default="ALL")
+parser.add_argument('-b', '--budgetstep', action='store', type=float, default=100.0) # in cents/month
+parser.add_argument('-m', '--maxbudget', action='store', type=float, default=1200.0) # in cents/month
+parser.add_argument('-n', '--fractions', action='store', type=int, default=101) # L1 budget fractions in the [0, 1] grid
+parser.add_argument('-t', '--table', action='store', default='optimal_splits.csv')
 
 args = parser.parse_args()
 
 cost_size = 1024*1024*1024 # 1 GB
+unit_size = 1 if args.sized else args.unitsize
 storage_technologies = {"FastDB" : 10,
                         "ModDB"  : 50,
                         "SlowDB" : 100}
@@ -62,45 +69,27 @@ def create_datasets(results):
     f.close()
 
 
-l1_size_factor = cost_size / (args.unitsize * args.ramcost)
+l1_size_factor = cost_size / (unit_size * args.ramcost)
 if args.verbose:
     print("l1_size_factor:", round(l1_size_factor,4))
-l2_size_factor = cost_size / (args.unitsize * args.ssdcost)
+l2_size_factor = cost_size / (unit_size * args.ssdcost)
 if args.verbose:
     print("l2_size_factor:", round(l2_size_factor,4))
 
 
-def latency_estimation(total_budgets, l1_budgets, f, nacceses, minx, maxx, remote_latency):
-    # L(B,B1)=fh(B1*X)*A1+fh((B-B1)*Y)*A2+(1-fh((B1*X)+((B-B1)*Y)))*AS
-    l1_sizes = l1_budgets * l1_size_factor
+def latency_estimation(total_budgets, l1_budgets, f, nacceses, maxx, remote_latency):
+    # L(B,B1)=fh(B1*X)*A1+(fh(B1*X+(B-B1)*Y)-fh(B1*X))*A2+(1-fh(B1*X+(B-B1)*Y))*AS
+    # budgets, fractions and remote latencies broadcast against each other, f is flat past the measured sizes
+    l1_sizes = np.clip(l1_budgets * l1_size_factor, 0, maxx)
+    total_sizes = np.clip(l1_budgets * l1_size_factor + (total_budgets - l1_budgets) * l2_size_factor, 0, maxx)
     if args.verbose:
         print("l1_size:", l1_sizes)
         print("Expected L1 hit ratio:", f(l1_sizes))
-    minx = np.full(len(l1_sizes),minx)
-    maxx = np.full(len(l1_sizes), maxx)
-    l1_sizes = np.fmax(l1_sizes, minx)
-    l1_sizes = np.fmin(l1_sizes, maxx)
-    if args.verbose:
-        print("Corrected Expected L1 hit ratio:", f(l1_sizes))
-    l2_sizes = (total_budgets - l1_budgets) * l2_size_factor
-    if args.verbose:
-        print("l2_sizes:", l2_sizes)
-        print("Expected L2 hit ratio:", f(l2_sizes))
-    l2_sizes = np.fmax(l2_sizes, minx)
-    l2_sizes = np.fmin(l2_sizes, maxx)
-    if args.verbose:
-        print("Corrected Expected L2 hit ratio:", f(l2_sizes))
-    total_sizes = l1_budgets * l1_size_factor + (total_budgets - l1_budgets) * l2_size_factor
-    if args.verbose:
         print("Total Sizes:", total_sizes)
         print("Expected total hit ratio:", f(total_sizes))
-    total_sizes = np.fmax(total_sizes, minx)
-    total_sizes = np.fmin(total_sizes, maxx)
-    if args.verbose:
-        print("Corrected Expected total hit ratio:", f(total_sizes))
     l1_share = f(l1_sizes) * nacceses
     remote_share = (1-f(total_sizes)) * nacceses
-    l2_share = nacceses - (l1_share - remote_share)
+    l2_share = nacceses - l1_share - remote_share
     if args.verbose:
         print("l1_shares:", l1_share)
         print("l2_share:", l2_share)
@@ -111,6 +100,41 @@ def latency_estimation(total_budgets, l1_budgets, f, nacceses, minx, maxx, remot
     return result
 
 
+# Shape-preserving interpolation of the hit ratio curve, anchored at (0, 0) and made non-decreasing, so the
+# estimate never overshoots between measured sizes nor extrapolates past them
+def hit_ratio_curve(data):
+    sizes = {0: 0.0}
+    for size, hitratio in data:
+        sizes[size] = max(hitratio, sizes.get(size, 0.0))
+    xs = np.array(sorted(sizes), dtype=float)
+    ys = np.maximum.accumulate(np.array([sizes[x] for x in sorted(sizes)]))
+    return PchipInterpolator(xs, ys, extrapolate=False), xs[-1]
+
+
+# Evaluates the whole storage x budget x L1 fraction grid at once, then refines every coarse minimum with a
+# bounded scalar minimization between its neighbouring grid fractions
+def optimize_splits(f, nacceses, maxx):
+    budgets = np.arange(args.budgetstep, args.maxbudget + args.budgetstep / 2, args.budgetstep)
+    fractions = np.linspace(0.0, 1.0, args.fractions)
+    remote_latencies = np.array(list(storage_technologies.values()), dtype=float)
+    total_budgets = budgets[np.newaxis, :, np.newaxis]
+    latencies = latency_estimation(total_budgets, total_budgets * fractions, f, nacceses, maxx, remote_latencies[:, np.newaxis, np.newaxis])
+    coarse = np.argmin(latencies, axis=2)
+    best = {}
+    for s, storage in enumerate(storage_technologies):
+        best[storage] = []
+        for b, budget in enumerate(budgets):
+            i = coarse[s, b]
+            low, high = fractions[max(0, i - 1)], fractions[min(len(fractions) - 1, i + 1)]
+            fraction, latency = fractions[i], latencies[s, b, i]
+            if high > low:
+                refined = minimize_scalar(lambda x: latency_estimation(budget, budget * x, f, nacceses, maxx, remote_latencies[s]), bounds=(low, high), method='bounded')
+                if refined.fun < latency:
+                    fraction, latency = refined.x, refined.fun
+            best[storage].append((budget, fraction, float(latency)))
+    return best
+
+
 def plot_budgets(trace,policy,storage,best_budgets,best_l1s,best_l2s,best_latencies):
     best_l1s = np.array(best_l1s)
     best_l2s = np.array(best_l2s)
@@ -143,40 +167,28 @@ def plot_budgets(trace,policy,storage,best_budgets,best_l1s,best_l2s,best_latenc
 
 results = parse_input()
 create_datasets(results)
+table = open(args.table, mode='w')
+table.write("Trace,Policy,Storage,Budget,L1_Fraction,L1_Budget,L2_Budget,L1_Size,L2_Size,Latency\n")
 for (trace, res) in results.items():
     for (policy, data) in res.items():
         if policy != 'nacceses':
             if args.verbose:
                 print("Trace:", trace, " Policy:", policy, "Nacceses: ", results[trace]['nacceses'])
                 print("Interpolating:",data)
-            xs,ys = map(list, zip(*data))
-            cs = CubicSpline(xs, ys, bc_type='not-a-knot', extrapolate=True)
-            minx = min(xs)
-            maxx = max(xs)
-            if args.verbose:
-                print("estimated HR:",cs([1000, 2000, 3000, 4000, 5000, 6000, 7000, 8000, 9000, 10000, 20000, 30000, 40000, 50000, 60000, 70000, 80000, 90000, 100000, 200000, 300000, 400000, 500000, 600000, 700000, 800000, 900000, 1000000]))
-            for storage, access_latency in storage_technologies.items():
+            f, maxx = hit_ratio_curve(data)
+            for storage, best in optimize_splits(f, results[trace]['nacceses'], maxx).items():
                 best_budgets = []
                 best_l1s = []
                 best_l2s = []
                 best_latencies = []
-                for total_budget in [100.0, 200.0, 300.0, 400.0, 500.0, 600.0, 700.0, 800.0, 900.0, 1000.0, 1100.0, 1200.0]:
-                    total_budgets = np.full(8,total_budget)
-                    l1_budgets = [0.01, 0.02, 0.05, 0.1, 0.2, 0.3, 0.4, 0.5] * total_budgets
-                    if args.verbose:
-                        print("total_budgets:", total_budgets)
-                        print("l1_budgets:", l1_budgets)
-                    estimated_latencies = latency_estimation(total_budgets, l1_budgets, cs, results[trace]['nacceses'], minx, maxx, access_latency)
-                    if args.verbose:
-                        print("Min for budget ", total_budgets[0], " is ", np.min(estimated_latencies), " at ", np.argmin(estimated_latencies), " = ", l1_budgets[np.argmin(estimated_latencies)], "(",l1_budgets[np.argmin(estimated_latencies)]/total_budgets[0],")")
-                        print("==================")
-                    best_budgets.append(total_budget)
-                    l1_best_budget = l1_budgets[np.argmin(estimated_latencies)]
-                    best_l1s.append(l1_best_budget)
-                    l2_best_budget = total_budget - l1_best_budget
-                    best_l2s.append(l2_best_budget)
-                    best_latencies.append(np.min(estimated_latencies))
+                for budget, fraction, latency in best:
+                    l1_budget = round(budget * fraction, 2)
+                    l2_budget = round(budget - l1_budget, 2)
+                    table.write("{},{},{},{},{:.4f},{},{},{},{},{:.1f}\n".format(trace, policy, storage, budget, fraction, l1_budget, l2_budget,
+                                                                    round(l1_budget * l1_size_factor), round(l2_budget * l2_size_factor), latency))
+                    best_budgets.append(budget)
+                    best_l1s.append(l1_budget)
+                    best_l2s.append(l2_budget)
+                    best_latencies.append(latency)
                 plot_budgets(trace, policy, storage, best_budgets, best_l1s, best_l2s, best_latencies)
-            #input("Press the Enter key to continue: ")
-
-
+table.close()
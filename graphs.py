@@ -1,19 +1,86 @@
+import hashlib
+import json
 import os.path
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 
+# Figures are rendered off-screen by a pool of worker processes. Every figure function takes the path of its
+# PNG followed by the data it plots; the hash of that input is kept in a manifest next to the images, and a
+# figure whose PNG exists with the same hash is not rendered again.
 
-def generate_weighted_graph(path,title,trace,policy,avoid,xlabel,ylabel,xvalues,aggresults,technologies):
+MANIFEST = '.rendered.json'
+
+
+class FigureRenderer(object):
+    def __init__(self, workers=0, force=False):
+        self.workers = workers if workers > 0 else (os.cpu_count() or 1)
+        self.force = force
+        self.executor = None
+        self.manifests = {}
+        self.pending = []
+        self.rendered = 0
+        self.skipped = 0
+
+    def manifest(self, directory):
+        if directory not in self.manifests:
+            self.manifests[directory] = {}
+            manifest_path = os.path.join(directory, MANIFEST)
+            if os.path.exists(manifest_path):
+                with open(manifest_path) as f:
+                    self.manifests[directory] = json.load(f)
+        return self.manifests[directory]
+
+    def submit(self, function, path, *fnargs):
+        digest = hashlib.sha1(pickle.dumps((function.__module__, function.__qualname__, path, fnargs), protocol=4)).hexdigest()
+        directory, name = os.path.split(path)
+        manifest = self.manifest(directory)
+        if not self.force and manifest.get(name) == digest and os.path.exists(path):
+            self.skipped += 1
+            return
+        if self.workers == 1:
+            function(path, *fnargs)
+            manifest[name] = digest
+            self.rendered += 1
+            return
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        self.pending.append((directory, name, digest, self.executor.submit(function, path, *fnargs)))
+
+    # Waits for the pending figures and records the hashes of the ones that were written
+    def close(self):
+        try:
+            for directory, name, digest, future in self.pending:
+                future.result()
+                self.manifests[directory][name] = digest
+                self.rendered += 1
+        finally:
+            self.pending = []
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
+            for directory, manifest in self.manifests.items():
+                if not os.path.isdir(directory or '.'):
+                    continue
+                manifest_path = os.path.join(directory, MANIFEST)
+                with open(manifest_path + ".tmp", 'w') as f:
+                    json.dump(manifest, f, indent=0, sort_keys=True)
+                os.replace(manifest_path + ".tmp", manifest_path)
+        return self.rendered, self.skipped
+
+
+def generate_weighted_graph(path,xlabel,ylabel,xvalues,curves):
     plt.figure(figsize=(1.8 * len(xvalues), 6))
     plt.rc('xtick', labelsize=18)
     plt.rc('ytick', labelsize=18)
-    for technology in technologies:
-        if technology != avoid:
-            yvalues = list(map(lambda wat: wat[technology], aggresults[trace][policy].values()))
-            plt.plot(xvalues, yvalues, label=technology)
+    for technology, yvalues in curves:
+        plt.plot(xvalues, yvalues, label=technology)
     plt.xlabel(xlabel,fontsize=20)
     plt.ylabel(ylabel, fontsize=20)
     plt.legend()
-    plt.savefig(os.path.join(path,trace+"-"+title+".png"), bbox_inches='tight')
+    plt.savefig(path, bbox_inches='tight')
     plt.close()
 
 
@@ -25,31 +92,41 @@ def init_hitrate_graph(numvalues):
 def add_to_hitrate_graph(policy, xvalues, yvalues):
     plt.plot(xvalues, yvalues, label=policy)
 
-def finish_hitrate_graph(path, trace):
+def finish_hitrate_graph(path):
     plt.xlabel("Cache Size",fontsize=20)
     plt.ylabel("Hit Ratio (%)", fontsize=20)
     plt.legend()
-    plt.savefig(os.path.join(path,trace+"-hit_ratio.png"), bbox_inches='tight')
+    plt.savefig(path, bbox_inches='tight')
     plt.close()
 
 
-def generate_hit_graph(path, aggresults):
+def generate_trace_hit_graph(path, numvalues, curves):
+    init_hitrate_graph(numvalues)
+    for policy, sizes, hitratios in curves:
+        add_to_hitrate_graph(policy, sizes, hitratios)
+    finish_hitrate_graph(path)
+
+
+def generate_hit_graph(renderer, path, aggresults):
     for trace in aggresults.keys():
-        init_hitrate_graph(len((list(aggresults[trace].items()))[0][1].keys()))
+        curves = []
         for policy in aggresults[trace].keys():
-            sizes = aggresults[trace][policy].keys()
+            sizes = list(aggresults[trace][policy].keys())
             hitratios = list(map(lambda ht: ht["hit ratio"], aggresults[trace][policy].values()))
-            add_to_hitrate_graph(policy,sizes,hitratios)
-        finish_hitrate_graph(path, trace)
+            curves.append((policy, sizes, hitratios))
+        renderer.submit(generate_trace_hit_graph, os.path.join(path, trace+"-hit_ratio.png"), len((list(aggresults[trace].items()))[0][1].keys()), curves)
 
 
-def generate_all_weighted_graphs(path, aggresults, technologies):
+def generate_all_weighted_graphs(renderer, path, aggresults, technologies):
     for trace in aggresults.keys():
         for policy in aggresults[trace].keys():
-            sizes = aggresults[trace][policy].keys()
-            generate_weighted_graph(path, "weighted-"+policy, trace, policy, "hit ratio", "Cache Size", "Access Time (ms)", sizes, aggresults, technologies)
+            sizes = list(aggresults[trace][policy].keys())
+            curves = [(technology, list(map(lambda wat: wat[technology], aggresults[trace][policy].values()))) for technology in technologies if technology != "hit ratio"]
+            renderer.submit(generate_weighted_graph, os.path.join(path, trace+"-weighted-"+policy+".png"), "Cache Size", "Access Time (ms)", sizes, curves)
 
 
-def generate_all_graphs(path, aggresults, technologies):
-    generate_hit_graph(path, aggresults)
-    generate_all_weighted_graphs(path, aggresults, technologies)
\ No newline at end of file
+def generate_all_graphs(path, aggresults, technologies, workers=0, force=False):
+    renderer = FigureRenderer(workers, force)
+    generate_hit_graph(renderer, path, aggresults)
+    generate_all_weighted_graphs(renderer, path, aggresults, technologies)
+    return renderer.close()
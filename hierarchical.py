@@ -18,28 +18,51 @@ from levelpolicies import LLRU
 # It seems that we also need to compute accesses and not just hits and misses.
 
 
+# Each level is any LevelPolicy class (levelpolicies.py), LLRU for both by default
 class HierarchicalCache(object):
-    def __init__(self, l1_maximum_size, l2_maximum_size):
+    def __init__(self, l1_maximum_size, l2_maximum_size, l1_policy=LLRU, l2_policy=LLRU):
         self.l1_maximum_size = l1_maximum_size
         self.l2_maximum_size = l2_maximum_size
+        self.l1_policy = l1_policy
+        self.l2_policy = l2_policy
         self.misses = 0
         self.hits = 0
         self.accesses = 0
         self.remote_accesses = 0
         self.remote_writes = 0
         self.remote_charged = 0
-        self.l1_cache = LLRU(l1_maximum_size)
-        self.l2_cache = LLRU(l2_maximum_size)
+        self.byte_hits = 0
+        self.byte_misses = 0
+        self.l1_cache = l1_policy(l1_maximum_size)
+        self.l2_cache = l2_policy(l2_maximum_size)
         pass
 
     def get_stats(self):
         res1 = self.l1_cache.get_stats()
         res2 = self.l2_cache.get_stats()
-        return {'name': self.__class__.__name__, 'l1_size': res1['size'], 'l2_size': res2['size'], 'l1_hits': res1['hits'], 'l1_misses': res1['misses'], 'l1_accesses': res1['accesses'], 'l1_writes': res1['writes'], 'l1_charged': res1['charged'], 'l1_hit_ratio': res1['hit ratio'], 'l2_hits': res2['hits'], 'l2_misses': res2['misses'], 'l2_accesses': res2['accesses'], 'l2_writes': res2['writes'], 'l2_charged': res2['charged'], 'l2_hit_ratio': res2['hit ratio'], 'total_hits': self.hits, 'total_misses': self.misses, 'total_accesses': self.accesses, 'remote_accesses': self.remote_accesses, 'remote_writes': self.remote_writes, 'remote_charged': self.remote_charged, 'total_hit_ratio': self.hits/(self.hits+self.misses)}
+        return {'name': self.get_name(), 'l1_size': res1['size'], 'l2_size': res2['size'], 'l1_hits': res1['hits'], 'l1_misses': res1['misses'], 'l1_accesses': res1['accesses'], 'l1_writes': res1['writes'], 'l1_charged': res1['charged'], 'l1_hit_ratio': res1['hit ratio'], 'l2_hits': res2['hits'], 'l2_misses': res2['misses'], 'l2_accesses': res2['accesses'], 'l2_writes': res2['writes'], 'l2_charged': res2['charged'], 'l2_hit_ratio': res2['hit ratio'], 'total_hits': self.hits, 'total_misses': self.misses, 'total_accesses': self.accesses, 'remote_accesses': self.remote_accesses, 'remote_writes': self.remote_writes, 'remote_charged': self.remote_charged, 'total_hit_ratio': self.hits/max(1, self.hits+self.misses),
+                'total_byte_hits': self.byte_hits, 'total_byte_misses': self.byte_misses, 'total_byte_hit_ratio': self.byte_hits/max(1, self.byte_hits+self.byte_misses)}
        # return {'name' : self.__class__.__name__, 'size' : self.maximum_size, 'hits' : self.hits, 'misses' : self.misses, 'accesses' : self.accesses, 'hit ratio' : self.hits / (self.hits + self.misses) }
 
+    def is_lru(self):
+        return self.l1_policy is LLRU and self.l2_policy is LLRU
+
+    # e.g. HierarchicalCache(LWTinyLFU/LClock), the LLRU/LLRU hierarchy keeps its plain name and parameters
     def get_name(self):
-        return self.__class__.__name__
+        if self.is_lru():
+            return self.__class__.__name__
+        return "{}({}/{})".format(self.__class__.__name__, self.l1_policy.__name__, self.l2_policy.__name__)
+
+    def get_params(self):
+        params = {'l1_maximum_size': self.l1_maximum_size, 'l2_maximum_size': self.l2_maximum_size}
+        if not self.is_lru():
+            params['l1_policy'] = self.l1_policy.__name__
+            params['l2_policy'] = self.l2_policy.__name__
+        return params
+
+    # The same hierarchy with other level sizes
+    def resized(self, l1_maximum_size, l2_maximum_size):
+        return self.__class__(l1_maximum_size, l2_maximum_size, self.l1_policy, self.l2_policy)
 
     def reset(self):
         self.misses = 0
@@ -48,9 +71,16 @@ class HierarchicalCache(object):
         self.remote_accesses = 0
         self.remote_writes = 0
         self.remote_charged = 0
+        self.byte_hits = 0
+        self.byte_misses = 0
         self.l1_cache.reset()
         self.l2_cache.reset()
 
+    # Dense key ids are replayed as they are, levels that hash the keys get the original ones
+    def use_dense_keys(self, unique_keys):
+        self.l1_cache.use_dense_keys(unique_keys)
+        self.l2_cache.use_dense_keys(unique_keys)
+
     # We handle the l2 victims by writing back victims that were modified
     # Yet, we do not count a remote_charge for them since we assume write-backs are totally asynchronous
     def handle_l2_victim(self, victim):
@@ -73,24 +103,40 @@ class HierarchicalCache(object):
         (l1_hit,l1_victims) = self.l1_cache.record(key, size, status, count=count,  allcharge=allcharge)
         if l1_hit:
             self.hits += 1
+            self.byte_hits += size
         for victim in l1_victims:
             self.handle_l1_victim(victim)
+        return l1_hit
+
+    def record_many(self, keys, sizes=None, statuses=None):
+        record = self.record
+        sizes = [1] * len(keys) if sizes is None else sizes.tolist()
+        statuses = [None] * len(keys) if statuses is None else statuses.tolist()
+        for key, size, status in zip(keys.tolist(), sizes, statuses):
+            record(key, size, status)
 
     def record(self, key, size=1, status=None):
         self.accesses += 1
+        # A write overwrites the item in L1: a miss is counted, but it needs no remote read, the dirty item is
+        # written back when it leaves L2
         if status:
-            self.l1_record(key, size, status)
+            if not self.l1_record(key, size, status):
+                self.misses += 1
+                self.byte_misses += size
             return
         hit = self.l1_cache.try_access(key, allcharge=True)
         if hit:
             self.hits += 1
+            self.byte_hits += size
             return
         hit = self.l2_cache.try_access(key, allcharge=False) # allcharge=False since we assume a bloom filter that prevents misses from invoking an access to SSD
         if hit:
             self.hits += 1
+            self.byte_hits += size
             self.l1_record(key, size, status, count=False, allcharge=False) # count=False since we already counted hit/miss/access during the try_access
         else:
             self.misses += 1
+            self.byte_misses += size
             self.remote_accesses += 1
             self.remote_charged += 1 # we simulate a read by charging the latency
             self.l1_record(key, size, status, count=False, allcharge=False) # count=False since we already counted hit/miss/access during the try_access
@@ -1,3 +1,19 @@
+import pyximport; pyximport.install()
+from cms import CMS
+
+# A level of HierarchicalCache. The hierarchy talks to every level through the same contract:
+# - try_access(key, allcharge) is a read that only hits or misses, a missed key is not brought in;
+# - record(key, size, status, count, allcharge) brings the key in (a truthy status marks it dirty) and returns
+#   (hit, victims), the victims being the (key, size, status) of the items that left the level to make room.
+# count=False records a key whose access was already counted (e.g. by try_access) or that is only written back
+# from the level above, allcharge also charges the latency of a miss. Levels implement promote() and insert()
+# and inherit the counting, LLRU implements the contract directly.
+
+PROBATION = 0
+PROTECTED = 1
+WINDOW = 2
+
+
 class LevelPolicy(object):
     def __init__(self, maximum_size):
         self.maximum_size = maximum_size
@@ -16,18 +32,64 @@ class LevelPolicy(object):
         self.charged = 0
         pass
 
-    def try_access(self, key, status=None):
+    # Levels see the dense ids of a dense trace, the ones that hash the keys map them back
+    def use_dense_keys(self, unique_keys):
+        pass
+
+    # A hit of a resident key, which is marked dirty by a truthy status. Returns False when it is not resident
+    def promote(self, key, status=None):
         return False
 
-    def record(self, key, size=1, status=None):
-        return False,[]
+    # Brings in a missed key of at most maximum_size, returns the victims
+    def insert(self, key, size=1, status=None):
+        return []
+
+    def try_access(self, key, allcharge=False):
+        self.accesses += 1
+        if self.promote(key):
+            self.hits += 1
+            self.charged += 1
+            return True
+        if allcharge:
+            self.charged += 1
+        self.misses += 1
+        return False
+
+    def record(self, key, size=1, status=None, count=True, allcharge=False):
+        if count:
+            self.accesses += 1
+        if self.promote(key, status):
+            if count:
+                self.hits += 1
+                self.charged += 1
+            if status:
+                self.writes += 1
+            return True,[]
+        if count:
+            self.misses += 1
+        self.writes += 1
+        if allcharge:
+            self.charged += 1
+        if size > self.maximum_size:
+            return False,[]
+        return False,self.insert(key, size, status)
+
+    def record_many(self, keys, sizes=None, statuses=None):
+        record = self.record
+        sizes = [1] * len(keys) if sizes is None else sizes.tolist()
+        statuses = [None] * len(keys) if statuses is None else statuses.tolist()
+        for key, size, status in zip(keys.tolist(), sizes, statuses):
+            record(key, size, status)
 
     def get_stats(self):
-        return {'name' : self.__class__.__name__, 'size' : self.maximum_size, 'hits' : self.hits, 'misses' : self.misses, 'accesses' : self.accesses, 'writes' : self.writes, 'charged' : self.charged, 'hit ratio' : self.hits / (self.hits + self.misses) }
+        return {'name' : self.__class__.__name__, 'size' : self.maximum_size, 'hits' : self.hits, 'misses' : self.misses, 'accesses' : self.accesses, 'writes' : self.writes, 'charged' : self.charged, 'hit ratio' : self.hits / max(1, self.hits + self.misses) }
 
     def get_name(self):
         return self.__class__.__name__
 
+    def get_params(self):
+        return {'maximum_size' : self.maximum_size}
+
 
 class LLRU(LevelPolicy):
     def __init__(self, maximum_size):
@@ -92,13 +154,236 @@ class LLRU(LevelPolicy):
             return False,victims
 
 
+# CLOCK over flat slot arrays, no object per item, as the cheap policy of the large SSD level. A hit only sets
+# the reference bit of its slot; the hand clears the bits it passes and evicts the first unreferenced item.
+# Freed slots (size 0) are taken by the next insertions.
+class LClock(LevelPolicy):
+    def __init__(self, maximum_size):
+        super().__init__(maximum_size)
+        self.reset_slots()
+
+    def reset(self):
+        super().reset()
+        self.reset_slots()
+
+    def reset_slots(self):
+        self.current_size = 0
+        self.data = {}
+        self.keys = []
+        self.sizes = []
+        self.statuses = []
+        self.referenced = bytearray()
+        self.free = []
+        self.hand = 0
+
+    def promote(self, key, status=None):
+        slot = self.data.get(key)
+        if slot is None:
+            return False
+        self.referenced[slot] = 1
+        if status:
+            self.statuses[slot] = status
+        return True
+
+    def insert(self, key, size=1, status=None):
+        self.current_size += size
+        victims = []
+        while self.current_size > self.maximum_size:
+            victims.append(self.evict())
+        if self.free:
+            slot = self.free.pop()
+            self.keys[slot] = key
+            self.sizes[slot] = size
+            self.statuses[slot] = status
+            self.referenced[slot] = 0
+        else:
+            slot = len(self.keys)
+            self.keys.append(key)
+            self.sizes.append(size)
+            self.statuses.append(status)
+            self.referenced.append(0)
+        self.data[key] = slot
+        return victims
+
+    def evict(self):
+        sizes = self.sizes
+        referenced = self.referenced
+        hand = self.hand
+        while True:
+            if hand == len(sizes):
+                hand = 0
+            if sizes[hand] and not referenced[hand]:
+                break
+            referenced[hand] = 0
+            hand += 1
+        victim = (self.keys[hand], sizes[hand], self.statuses[hand])
+        del self.data[victim[0]]
+        self.current_size -= sizes[hand]
+        sizes[hand] = 0
+        self.statuses[hand] = None
+        self.free.append(hand)
+        self.hand = hand + 1
+        return victim
+
+
+# Segmented LRU: missed keys enter the probation segment, a hit there moves the key to the protected segment
+# (protected_percentage of the capacity), whose LRU keys are demoted back to probation. Victims are taken from
+# probation first.
+class LSLRU(LevelPolicy):
+    def __init__(self, maximum_size, protected_percentage=80):
+        super().__init__(maximum_size)
+        self.max_protected = maximum_size * protected_percentage // 100
+        self.reset_segments()
+
+    def reset(self):
+        super().reset()
+        self.reset_segments()
+
+    def reset_segments(self):
+        self.current_size = 0
+        self.size_protected = 0
+        self.data = {}
+        self.sentinel_probation = LNode()
+        self.sentinel_protected = LNode()
+
+    def promote(self, key, status=None):
+        node = self.data.get(key)
+        if node is None:
+            return False
+        node.remove()
+        if node.segment == PROBATION:
+            node.segment = PROTECTED
+            self.size_protected += node.size
+            node.append_to_tail(self.sentinel_protected)
+            self.demote_protected()
+        else:
+            node.append_to_tail(self.sentinel_protected)
+        if status:
+            node.status = status
+        return True
+
+    def demote_protected(self):
+        while self.size_protected > self.max_protected:
+            demote = self.sentinel_protected.next_node
+            demote.remove()
+            demote.segment = PROBATION
+            demote.append_to_tail(self.sentinel_probation)
+            self.size_protected -= demote.size
+
+    def insert(self, key, size=1, status=None):
+        self.current_size += size
+        victims = []
+        while self.current_size > self.maximum_size:
+            victim = self.sentinel_probation.next_node
+            if victim is self.sentinel_probation:
+                victim = self.sentinel_protected.next_node
+                self.size_protected -= victim.size
+            victim.remove()
+            del self.data[victim.data]
+            self.current_size -= victim.size
+            victims.append((victim.data, victim.size, victim.status))
+        new_node = LNode(key, size=size, status=status, segment=PROBATION)
+        new_node.append_to_tail(self.sentinel_probation)
+        self.data[key] = new_node
+        return victims
+
+
+# W-TinyLFU as in policies.py as a level: an LRU window of window_percentage of the capacity in front of an SLRU
+# main area, a window candidate enters the main area only if the sketch estimates it more frequent than the
+# probation victim. Every counted access increments the sketch, write-backs from the level above do not. Items
+# are counted as units of capacity. With dense key ids the sketch sees the original keys.
+class LWTinyLFU(LevelPolicy):
+    def __init__(self, maximum_size, window_percentage=1):
+        super().__init__(maximum_size)
+        self.max_window_size = (maximum_size * window_percentage) // 100
+        self.max_protected = (maximum_size - self.max_window_size) * 4 // 5
+        self.original_keys = None
+        self.reset_segments()
+
+    def reset(self):
+        super().reset()
+        self.original_keys = None
+        self.reset_segments()
+
+    def reset_segments(self):
+        self.cms = CMS(self.maximum_size)
+        self.size_window = 0
+        self.size_protected = 0
+        self.data = {}
+        self.sentinel_window = LNode()
+        self.sentinel_probation = LNode()
+        self.sentinel_protected = LNode()
+
+    # The (memory-mapped) keys of the trace are indexed as they are, nothing is copied into the level
+    def use_dense_keys(self, unique_keys):
+        self.original_keys = unique_keys
+
+    # The sketch takes unsigned 64-bit keys, negative ones wrap around like in the compiled WTinyLFU
+    def sketch_key(self, key):
+        return (key if self.original_keys is None else int(self.original_keys[key])) & 0xFFFFFFFFFFFFFFFF
+
+    def try_access(self, key, allcharge=False):
+        self.cms.increment(self.sketch_key(key))
+        return super().try_access(key, allcharge)
+
+    def record(self, key, size=1, status=None, count=True, allcharge=False):
+        if count:
+            self.cms.increment(self.sketch_key(key))
+        return super().record(key, size, status, count, allcharge)
+
+    def promote(self, key, status=None):
+        node = self.data.get(key)
+        if node is None:
+            return False
+        node.remove()
+        if node.segment == WINDOW:
+            node.append_to_tail(self.sentinel_window)
+        elif node.segment == PROBATION:
+            node.segment = PROTECTED
+            node.append_to_tail(self.sentinel_protected)
+            self.size_protected += 1
+            if self.size_protected > self.max_protected:
+                demote = self.sentinel_protected.next_node
+                demote.remove()
+                demote.segment = PROBATION
+                demote.append_to_tail(self.sentinel_probation)
+                self.size_protected -= 1
+        else:
+            node.append_to_tail(self.sentinel_protected)
+        if status:
+            node.status = status
+        return True
+
+    def insert(self, key, size=1, status=None):
+        new_node = LNode(key, size=size, status=status, segment=WINDOW)
+        new_node.append_to_tail(self.sentinel_window)
+        self.data[key] = new_node
+        self.size_window += 1
+        if self.size_window <= self.max_window_size:
+            return []
+        candidate = self.sentinel_window.next_node
+        candidate.remove()
+        self.size_window -= 1
+        candidate.segment = PROBATION
+        candidate.append_to_tail(self.sentinel_probation)
+        if len(self.data) <= self.maximum_size:
+            return []
+        victim = self.sentinel_probation.next_node
+        if self.cms.frequency(self.sketch_key(candidate.data)) <= self.cms.frequency(self.sketch_key(victim.data)):
+            victim = candidate
+        victim.remove()
+        del self.data[victim.data]
+        return [(victim.data, victim.size, victim.status)]
+
+
 class LNode(object):
-    def __init__(self, data=None, size=1, status=None):
+    def __init__(self, data=None, size=1, status=None, segment=None):
         self.data = data
         self.next_node = self
         self.prev_node = self
         self.status = status
         self.size = size
+        self.segment = segment
 
     def remove(self):
         self.prev_node.next_node = self.next_node
@@ -115,5 +400,3 @@ class LNode(object):
         self.prev_node = sentinel
         self.prev_node.next_node = self
         self.next_node.prev_node = self
-
-
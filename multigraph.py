@@ -1,46 +1,75 @@
 import csv
 import argparse
 import os
+from graphs import FigureRenderer
 import matplotlib.pyplot as plt
 from matplotlib import cm
 import numpy as np
+from resultsdb import ResultsDB, MULTI_TABLE
 
 
 parser = argparse.ArgumentParser()
 parser.add_argument('-i', '--infile', action='store', default='multi-output.csv')
 parser.add_argument('-d', '--indir', action='store', default='.')
 parser.add_argument('-o', '--outdir', action='store', default='.\\graphs\\multilevel')
+parser.add_argument('-P', '--policy', action='store', default='HierarchicalCache') # multilevel policy whose rows are used
+parser.add_argument('-W', '--writes', action='store', type=bool, default=False) # with --database, the rows of write-aware replays (cacheck --writes)
+parser.add_argument('-D', '--database', action='store', default='') # read the results from this SQLite database instead of --infile
+parser.add_argument('-j', '--jobs', action='store', type=int, default=0) # worker processes rendering the figures, 0 for one per CPU
+parser.add_argument('-F', '--force', action='store', type=bool, default=False) # render every figure, even when its data did not change
 parser.add_argument('-v', '--verbose', action='store', type=bool, default=False)
 args = parser.parse_args()
 
 
-def multiplot_storage(storage,traceresults,X,Y,_x,_y):
-    fig = plt.figure(figsize=plt.figaspect(1))
-    ax = fig.add_subplot(1, 2, 1, projection='3d')
+def storage_surface(storage,traceresults,X,Y):
     _Z, _ = np.meshgrid(X, Y)
     for total, totalresults in traceresults.items():
         for percentage, percentageresults in totalresults.items():
             if args.verbose:
                 print(total, percentage)
-            _Z[np.where(Y == percentage)[0][0], np.where(X == total)[0][0]] = results[trace][total][percentage][storage]
+            _Z[np.where(Y == percentage)[0][0], np.where(X == total)[0][0]] = percentageresults[storage]
     if args.verbose:
         print("Z=", _Z)
+    return _Z
+
+
+def multiplot_storage(path,title,X,Y,_Z):
+    _X, _Y = np.meshgrid(X, Y)
     fig, ax = plt.subplots(subplot_kw={"projection": "3d"})
     surf = ax.plot_surface(_X, _Y, _Z, cmap=cm.coolwarm)
     fig.colorbar(surf, shrink=0.5, aspect=5)
     plt.xlabel("Total Cache Size")
     plt.ylabel("L1 Relative Size")
-    ax.set_title(trace.split(".txt")[0] + ":" + storage)
-    plt.savefig(os.path.join(args.outdir, trace.split(".txt")[0] + "-" + storage + ".png"), bbox_inches='tight')
+    ax.set_title(title)
+    plt.savefig(path, bbox_inches='tight')
     plt.close('all')
 
 
-results = {}
-with open(os.path.join(args.indir,args.infile), mode ='r') as file:
-    if args.verbose:
-        print("opened")
-    dictResults = csv.DictReader(file)
-    for row in dictResults:
+# The database columns are selected under the names of the CSV header, so both sources yield the same rows
+database_query = ("SELECT trace AS Trace, policy AS Policy, l1_size AS L1_Size, l2_size AS L2_Size, l1_hit_ratio AS L1_Hit_Ratio, l2_hit_ratio AS L2_Hit_Ratio, "
+                  "total_hit_ratio AS Total_Hit_Ratio, l1_accesses AS L1_Accesses, l2_accesses AS L2_Accesses, remote_accesses AS Remote_Accesses, "
+                  "l1_charged AS L1_Charged, l2_charged AS L2_Charged, remote_charged AS Remote_Charged, WeightedFastDB AS \" WeightedFastDB\", "
+                  "WeightedModDB AS \" WeightedModDB\", WeightedSlowDB AS \" WeightedSlowDB\" FROM {} WHERE trace = ? AND policy = ? AND writes = ?".format(MULTI_TABLE))
+
+
+def read_rows():
+    if args.database:
+        db = ResultsDB(args.database)
+        for trace in db.traces(MULTI_TABLE):
+            yield from db.query(database_query, (trace, args.policy, int(args.writes)))
+        db.close()
+    else:
+        with open(os.path.join(args.indir,args.infile), mode ='r') as file:
+            if args.verbose:
+                print("opened")
+            yield from csv.DictReader(file)
+
+
+def main():
+    results = {}
+    for row in read_rows():
+        if row['Policy'].strip() != args.policy:
+            continue
         trace = str(row['Trace']).strip()
         if trace not in results:
             results[trace] = {}
@@ -64,6 +93,7 @@ with open(os.path.join(args.indir,args.infile), mode ='r') as file:
         results[trace][total][percentage]['WeightedFastDB'] = float(row[' WeightedFastDB'])
         results[trace][total][percentage]['WeightedModDB'] = float(row[' WeightedModDB'])
         results[trace][total][percentage]['WeightedSlowDB'] = float(row[' WeightedSlowDB'])
+    renderer = FigureRenderer(args.jobs, args.force)
     for trace,traceresults in results.items():
         if args.verbose:
             print(trace)
@@ -77,17 +107,17 @@ with open(os.path.join(args.indir,args.infile), mode ='r') as file:
                     Y.append(percentage)
         X = np.array(X)
         Y = np.array(Y)
-        _X, _Y = np.meshgrid(X, Y)
         if args.verbose:
-            print(_X)
-            print(_Y)
+            print(X)
+            print(Y)
         for storage in ["FastDB","ModDB","SlowDB"]:
-            multiplot_storage("Weighted"+storage,traceresults,X,Y,_X,_Y)
-
-
-
-
-
-
+            _Z = storage_surface("Weighted"+storage,traceresults,X,Y)
+            renderer.submit(multiplot_storage, os.path.join(args.outdir, trace.split(".txt")[0] + "-Weighted" + storage + ".png"),
+                            trace.split(".txt")[0] + ":Weighted" + storage, X, Y, _Z)
+    rendered, skipped = renderer.close()
+    if args.verbose:
+        print("rendered:", rendered, "unchanged:", skipped)
 
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+from heapq import heappop, heappush
+
+import numpy as np
+
+from simplepolicies import Policy
+
+# Offline optimal replacement, the upper bound of every policy of the sweep. An offline policy is prepared with
+# the next-use index of the whole trace before the replay: the position of the next request of every request's
+# key, computed in one vectorized pass (a stable sort groups the requests of every key in time order) and shared
+# as one int64 array by all the configurations replaying the trace. The replay then evicts the
+# resident key needed farthest in the future (Belady's MIN), found with a max-heap whose stale entries are
+# dropped lazily, O(n log n) overall. A missed key that is needed no sooner than every resident key bypasses
+# the cache. Only unit-size items are supported.
+
+
+def trace_keys(trace):
+    return np.concatenate([chunk if chunk.ndim == 1 else chunk[:, 0] for chunk in trace.chunks(1 << 16)] or [np.empty(0, dtype=np.int64)])
+
+
+# next_uses[t] is the position of the next request of keys[t], or len(keys) if it is never requested again
+def next_use(keys):
+    n = len(keys)
+    order = np.argsort(keys, kind='stable')
+    next_uses = np.full(n, n, dtype=np.int64)
+    same = keys[order[1:]] == keys[order[:-1]]
+    next_uses[order[:-1][same]] = order[1:][same]
+    return next_uses
+
+
+class BeladyMIN(Policy):
+    def __init__(self, maximum_size):
+        super().__init__(maximum_size)
+        self.next_uses = None
+        self.position = 0
+        self.admissions = 0
+        self.resident = {}
+        self.heap = []
+
+    def reset(self):
+        super().reset()
+        self.next_uses = None
+        self.position = 0
+        self.admissions = 0
+        self.resident = {}
+        self.heap = []
+
+    # next_uses as computed by next_use() for the replayed trace
+    def prepare(self, next_uses):
+        self.next_uses = next_uses
+
+    # Returns the key that left (or bypassed) the cache, None when nothing did
+    def access(self, key, next_request):
+        resident = self.resident
+        heap = self.heap
+        if key in resident:
+            self.hits += 1
+            self.byte_hits += 1
+            resident[key] = next_request
+            heappush(heap, (-next_request, key))
+            return None
+        self.misses += 1
+        self.byte_misses += 1
+        victim = None
+        if self.maximum_size < 1: # nothing fits, every miss bypasses the cache
+            return key
+        if len(resident) >= self.maximum_size:
+            while -heap[0][0] != resident.get(heap[0][1]):
+                heappop(heap)
+            farthest, victim = heap[0]
+            if -farthest <= next_request:
+                return key
+            heappop(heap)
+            del resident[victim]
+        resident[key] = next_request
+        heappush(heap, (-next_request, key))
+        self.admissions += 1
+        return victim
+
+    def record(self, key, size=1):
+        self.access(key, int(self.next_uses[self.position]))
+        self.position += 1
+
+    def record_many(self, keys, sizes=None):
+        access = self.access
+        next_uses = self.next_uses[self.position:self.position + len(keys)].tolist()
+        for key, next_request in zip(keys.tolist(), next_uses):
+            access(key, next_request)
+        self.position += len(keys)
+
+
+# The L1/L2 configuration of HierarchicalCache under offline control. OPT is a stack algorithm, so the keys
+# MIN keeps in L1 are always among those it keeps in L1+L2: L1 is MIN(l1 size), L1 and L2 together are
+# MIN(l1 size + l2 size) and L2 holds the difference, both bounds are reached at once. A key leaving L1 that
+# is still kept is written to L2. The counters follow HierarchicalCache: every request is charged to L1, L1
+# misses probe L2 and are charged there only when they hit, and L2 misses are remote reads.
+class HierarchicalOPT(object):
+    def __init__(self, l1_maximum_size, l2_maximum_size):
+        self.l1_maximum_size = l1_maximum_size
+        self.l2_maximum_size = l2_maximum_size
+        self.l1_cache = BeladyMIN(l1_maximum_size)
+        self.cache = BeladyMIN(l1_maximum_size + l2_maximum_size)
+        self.l2_writes = 0
+
+    def get_name(self):
+        return self.__class__.__name__
+
+    def get_params(self):
+        return {'l1_maximum_size': self.l1_maximum_size, 'l2_maximum_size': self.l2_maximum_size}
+
+    def resized(self, l1_maximum_size, l2_maximum_size):
+        return self.__class__(l1_maximum_size, l2_maximum_size)
+
+    def reset(self):
+        self.l1_cache.reset()
+        self.cache.reset()
+        self.l2_writes = 0
+
+    def use_dense_keys(self, unique_keys):
+        pass
+
+    def prepare(self, next_uses):
+        self.l1_cache.prepare(next_uses)
+        self.cache.prepare(next_uses)
+
+    def record(self, key, size=1, status=None):
+        next_request = int(self.cache.next_uses[self.cache.position])
+        self.cache.access(key, next_request)
+        victim = self.l1_cache.access(key, next_request)
+        if victim is not None and victim in self.cache.resident:
+            self.l2_writes += 1
+        self.l1_cache.position += 1
+        self.cache.position += 1
+
+    def record_many(self, keys, sizes=None, statuses=None):
+        l1_access = self.l1_cache.access
+        access = self.cache.access
+        resident = self.cache.resident
+        position = self.cache.position
+        l2_writes = 0
+        for key, next_request in zip(keys.tolist(), self.cache.next_uses[position:position + len(keys)].tolist()):
+            access(key, next_request)
+            victim = l1_access(key, next_request)
+            if victim is not None and victim in resident:
+                l2_writes += 1
+        self.l2_writes += l2_writes
+        self.l1_cache.position += len(keys)
+        self.cache.position += len(keys)
+
+    # Same dictionary as HierarchicalCache.get_stats()
+    def get_stats(self):
+        n = self.cache.hits + self.cache.misses
+        l1_hits = self.l1_cache.hits
+        l1_misses = self.l1_cache.misses
+        total_hits = self.cache.hits
+        total_misses = self.cache.misses
+        l2_hits = total_hits - l1_hits
+        return {'name': self.get_name(), 'l1_size': self.l1_maximum_size, 'l2_size': self.l2_maximum_size,
+                'l1_hits': l1_hits, 'l1_misses': l1_misses, 'l1_accesses': n, 'l1_writes': self.l1_cache.admissions, 'l1_charged': n, 'l1_hit_ratio': l1_hits / max(1, n),
+                'l2_hits': l2_hits, 'l2_misses': l1_misses - l2_hits, 'l2_accesses': l1_misses, 'l2_writes': self.l2_writes, 'l2_charged': l2_hits, 'l2_hit_ratio': l2_hits / max(1, l1_misses),
+                'total_hits': total_hits, 'total_misses': total_misses, 'total_accesses': n,
+                'remote_accesses': total_misses, 'remote_writes': 0, 'remote_charged': total_misses, 'total_hit_ratio': total_hits / max(1, n),
+                'total_byte_hits': total_hits, 'total_byte_misses': total_misses, 'total_byte_hit_ratio': total_hits / max(1, n)}
@@ -1,4 +1,11 @@
+import mmap
+import os
 from collections import deque
+from itertools import islice
+
+import numpy as np
+import pyximport; pyximport.install()
+from redisreader import parse_block
 
 class Parser(object):
     def __init__(self, file_path):
@@ -16,6 +23,15 @@ class Parser(object):
         return self.items.pop()
     def parse(self, line):
         pass
+    # Streams the trace as int64 arrays of at most chunk_size requests: 1-D keys for plain traces,
+    # (n, 2) key/size rows for sized ones. Only one chunk is held in memory at a time.
+    def chunks(self, chunk_size):
+        while True:
+            chunk = np.array(list(islice(self, chunk_size)), dtype=np.int64)
+            if len(chunk) > 0:
+                yield chunk
+            if len(chunk) < chunk_size:
+                return
 
 class ArcParser(Parser):
     def parse(self, line):
@@ -34,7 +50,62 @@ class SizedParser(Parser):
         self.items.append((int(line[1]), int(line[2])))
 
 
+# 64-bit FNV-1a hash of the upper-cased command name, the code of the command in RedisParser.columns
+def redis_command_code(name):
+    code = 14695981039346656037
+    for c in name.upper().encode():
+        code = ((code ^ c) * 1099511628211) & 0xffffffffffffffff
+    return code - (1 << 64) if code >= 1 << 63 else code
+
+
+# Commands that modify the key, the others are replayed as reads
+REDIS_WRITE_COMMANDS = ['SET', 'SETEX', 'PSETEX', 'SETNX', 'SETRANGE', 'MSET', 'MSETNX', 'APPEND', 'GETSET', 'GETDEL', 'GETEX',
+                        'INCR', 'INCRBY', 'INCRBYFLOAT', 'DECR', 'DECRBY', 'DEL', 'UNLINK', 'RESTORE', 'RENAME', 'RENAMENX',
+                        'EXPIRE', 'PEXPIRE', 'EXPIREAT', 'PEXPIREAT', 'PERSIST', 'SETBIT', 'BITFIELD', 'PFADD',
+                        'HSET', 'HSETNX', 'HMSET', 'HDEL', 'HINCRBY', 'HINCRBYFLOAT',
+                        'LPUSH', 'RPUSH', 'LPUSHX', 'RPUSHX', 'LPOP', 'RPOP', 'LSET', 'LREM', 'LTRIM', 'LINSERT', 'RPOPLPUSH', 'LMOVE',
+                        'SADD', 'SREM', 'SPOP', 'SMOVE',
+                        'ZADD', 'ZREM', 'ZINCRBY', 'ZPOPMIN', 'ZPOPMAX', 'ZREMRANGEBYRANK', 'ZREMRANGEBYSCORE', 'ZREMRANGEBYLEX',
+                        'XADD', 'XDEL', 'XTRIM']
+
+
+# Bulk reader of the redis_anonymized_*.txt traces: the file is memory-mapped and tokenized a block of lines
+# at a time by redisreader into key, timestamp and command columns. Only the keys are replayed.
 class RedisParser(Parser):
-    def parse(self, line):
-        line = line.split()
-        self.items.append(int(line[1]))
\ No newline at end of file
+    def __init__(self, file_path):
+        self.file_path = file_path
+    def __iter__(self):
+        for chunk in self.chunks(1 << 16):
+            yield from chunk.tolist()
+    def chunks(self, chunk_size):
+        for keys, timestamps, commands in self.columns(chunk_size):
+            yield keys
+    # Yields (keys, timestamps, commands) arrays of at most chunk_size requests
+    def columns(self, chunk_size):
+        with open(self.file_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                if hasattr(buffer, 'madvise'):
+                    buffer.madvise(mmap.MADV_SEQUENTIAL)
+                position = 0
+                while True:
+                    keys = np.empty(chunk_size, dtype=np.int64)
+                    timestamps = np.empty(chunk_size, dtype=np.float64)
+                    commands = np.empty(chunk_size, dtype=np.int64)
+                    count, position = parse_block(buffer, position, keys, timestamps, commands)
+                    if count > 0:
+                        yield keys[:count], timestamps[:count], commands[:count]
+                    if count < chunk_size:
+                        return
+
+
+# The same trace as (key, size, op) rows, op is 1 for the write commands and 0 for reads. Items are unit-sized.
+class RedisOpParser(RedisParser):
+    write_codes = np.array([redis_command_code(name) for name in REDIS_WRITE_COMMANDS], dtype=np.int64)
+    def __iter__(self):
+        for chunk in self.chunks(1 << 16):
+            yield from map(tuple, chunk.tolist())
+    def chunks(self, chunk_size):
+        for keys, timestamps, commands in self.columns(chunk_size):
+            yield np.column_stack((keys, np.ones(len(keys), dtype=np.int64), np.isin(commands, self.write_codes).astype(np.int64)))
@@ -14,7 +14,7 @@ class Policy(object):
     def record(self, key, size=1):
         pass
     def get_stats(self):
-        return { 'name' : self.__class__.__name__, 'hits' : self.hits, 'misses' : self.misses, 'hit ratio' : self.hits / (self.hits + self.misses) } 
+        return { 'name' : self.__class__.__name__, 'hits' : self.hits, 'misses' : self.misses, 'hit ratio' : self.hits / max(1, self.hits + self.misses) } 
 
 class LRU(Policy):
     def __init__(self, maximum_size):
@@ -66,7 +66,7 @@ class WTinyLFU(Policy):
         node = self.data.get(key)
         if not node:
             self.misses += 1
-            new_node = Node(key, Node.Status.Window)
+            new_node = Node(key, status=Node.Status.Window)
             new_node.append_to_tail(self.sentinel_window)
             self.data[key] = new_node
             self.size_window += 1
@@ -204,7 +204,7 @@ class Indicator(object):
         return self.hinter_sum / self.hinter_count
     def est_skew(self):
         top_k = [ (i, log(k[1])) for i, k in zip(range(1,71), self.freqs.most_common(70)) ]
-        return -stats.linregress(top_k)[0]
+        return -stats.linregress(*zip(*top_k))[0]
     def get_indicator(self):
         skew = self.est_skew()
         return (self.get_hint() * ((1 - skew**3) if skew < 1 else 0)) / 15.0
@@ -0,0 +1,135 @@
+import cProfile
+import gc
+import sys
+import time
+
+try:
+    import resource
+except ImportError: # not available on Windows, peak RSS is left empty there
+    resource = None
+
+# Opt-in instrumentation of a single policy replay (cacheck --profile): throughput, peak RSS, allocations and
+# optionally a cProfile dump and sampled timings of the hot paths of the policy and of its cache levels.
+
+PROFILED_PATHS = ['record', 'evict', 'try_access', 'l1_record', 'handle_l1_victim', 'handle_l2_victim']
+PROFILED_LEVELS = ['l1_cache', 'l2_cache']
+
+
+# High-water mark of the whole process, a worker that ran a larger policy before keeps reporting its peak
+def peak_rss_kb():
+    if resource is None:
+        return ''
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+# Times one call out of every `period` calls of each hot path. The wrappers are set on the instances, so
+# compiled policies (whose methods cannot be replaced) are simply left untimed.
+class PathTimer(object):
+    def __init__(self, period):
+        self.period = period
+        self.calls = {}
+        self.timed = {}
+        self.total_ns = {}
+        self.attached = []
+
+    def attach(self, policy):
+        targets = [('', policy)] + [(level.split('_')[0] + '.', getattr(policy, level)) for level in PROFILED_LEVELS if hasattr(policy, level)]
+        for prefix, target in targets:
+            for name in PROFILED_PATHS:
+                method = getattr(target, name, None)
+                if method is None:
+                    continue
+                own = getattr(target, '__dict__', {}).get(name) # e.g. ArrayLRU.record set by use_dense_keys
+                try:
+                    setattr(target, name, self.wrap(prefix + name, method))
+                except AttributeError:
+                    continue
+                self.attached.append((target, name, own))
+
+    # Puts the methods back, so a policy replayed again (the next trace of a serial sweep) is not timed twice
+    def detach(self):
+        for target, name, own in reversed(self.attached):
+            if own is None:
+                delattr(target, name)
+            else:
+                setattr(target, name, own)
+        self.attached = []
+
+    def wrap(self, path, method):
+        self.calls[path] = 0
+        self.timed[path] = 0
+        self.total_ns[path] = 0
+        period = self.period
+        calls = self.calls
+        perf_counter_ns = time.perf_counter_ns
+        def timed_method(*args, **kwargs):
+            calls[path] += 1
+            if calls[path] % period:
+                return method(*args, **kwargs)
+            start = perf_counter_ns()
+            result = method(*args, **kwargs)
+            self.total_ns[path] += perf_counter_ns() - start
+            self.timed[path] += 1
+            return result
+        return timed_method
+
+    def get_stats(self):
+        return {path: round(self.total_ns[path] / self.timed[path]) for path in self.calls if self.timed[path] > 0}
+
+
+class RunProfile(object):
+    def __init__(self, period=0, dump_path=None):
+        self.paths = PathTimer(period) if period > 0 else None
+        self.dump_path = dump_path
+        self.profiler = None
+        self.requests = 0
+        self.elapsed_ns = 0
+
+    # Returns the record_many to replay the trace with. When paths are timed, requests go through record()
+    # one by one, since the batched fast paths bypass it.
+    def start(self, policy):
+        if self.paths is not None:
+            self.paths.attach(policy)
+        self.blocks = sys.getallocatedblocks()
+        self.collections = sum(stats['collections'] for stats in gc.get_stats())
+        if self.dump_path:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.started_ns = time.perf_counter_ns()
+        record = policy.record
+        record_many = policy.record_many
+        def profiled_record_many(keys, sizes=None, statuses=None):
+            self.requests += len(keys)
+            if self.paths is None:
+                if statuses is None:
+                    return record_many(keys, sizes)
+                return record_many(keys, sizes, statuses)
+            if sizes is None:
+                for key in keys.tolist():
+                    record(key)
+            elif statuses is None:
+                for key, size in zip(keys.tolist(), sizes.tolist()):
+                    record(key, size)
+            else:
+                for key, size, status in zip(keys.tolist(), sizes.tolist(), statuses.tolist()):
+                    record(key, size, status)
+        return profiled_record_many
+
+    def stop(self):
+        self.elapsed_ns = time.perf_counter_ns() - self.started_ns
+        if self.paths is not None:
+            self.paths.detach()
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.dump_path)
+        self.blocks = sys.getallocatedblocks() - self.blocks
+        self.collections = sum(stats['collections'] for stats in gc.get_stats()) - self.collections
+
+    def get_stats(self):
+        return {'requests': self.requests,
+                'requests/s': round(self.requests * 1e9 / max(1, self.elapsed_ns)),
+                'ns/request': round(self.elapsed_ns / max(1, self.requests)),
+                'peak rss kb': peak_rss_kb(),
+                'allocated blocks': self.blocks,
+                'gc collections': self.collections,
+                'paths': self.paths.get_stats() if self.paths is not None else {}}
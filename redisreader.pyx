@@ -0,0 +1,102 @@
+cimport cython
+from libc.stdint cimport int64_t, uint64_t
+from libc.math cimport NAN
+
+# Tokenizer of the anonymized Redis traces, one request per line: "<timestamp> <key> <command> ...". A block of
+# the (memory-mapped) file is scanned once in C, the fields are parsed in place and nothing but the three
+# columns is materialized. The timestamp is a decimal number (NaN when it is not one), the key an integer and
+# the command is kept as the 64-bit FNV-1a hash of its upper-cased name (0 when missing), see
+# parsers.redis_command_code. Blank lines are skipped, the rest of a line is ignored.
+
+cdef uint64_t FNV_OFFSET = 14695981039346656037ULL
+cdef uint64_t FNV_PRIME = 1099511628211ULL
+
+
+cdef inline bint is_blank(unsigned char c) nogil:
+    return c == 32 or c == 9 or c == 13
+
+
+cdef inline bint is_end(unsigned char c) nogil:
+    return c == 10 or is_blank(c)
+
+
+# Parses at most len(keys) lines starting at byte pos, returns (lines parsed, position after the last of them)
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def parse_block(const unsigned char[::1] data, Py_ssize_t pos, int64_t[::1] keys, double[::1] timestamps, int64_t[::1] commands):
+    cdef const unsigned char* buf = &data[0]
+    cdef Py_ssize_t n = data.shape[0]
+    cdef Py_ssize_t capacity = keys.shape[0]
+    cdef Py_ssize_t count = 0
+    cdef Py_ssize_t line_start
+    cdef unsigned char c
+    cdef uint64_t mantissa, scale
+    cdef bint numeric
+    cdef int64_t key
+    cdef bint negative
+    cdef uint64_t command
+    cdef bint malformed = False
+    with nogil:
+        while pos < n and count < capacity:
+            line_start = pos
+            while pos < n and is_blank(buf[pos]):
+                pos += 1
+            if pos == n:
+                break
+            if buf[pos] == 10:
+                pos += 1
+                continue
+            # timestamp, accumulated as an integer and scaled once
+            mantissa = 0
+            scale = 1
+            numeric = True
+            while pos < n and buf[pos] >= 48 and buf[pos] <= 57:
+                mantissa = mantissa * 10 + (buf[pos] - 48)
+                pos += 1
+            if pos < n and buf[pos] == 46:
+                pos += 1
+                while pos < n and buf[pos] >= 48 and buf[pos] <= 57:
+                    mantissa = mantissa * 10 + (buf[pos] - 48)
+                    scale *= 10
+                    pos += 1
+            while pos < n and not is_end(buf[pos]):
+                numeric = False
+                pos += 1
+            # key
+            while pos < n and is_blank(buf[pos]):
+                pos += 1
+            negative = pos < n and buf[pos] == 45
+            if negative:
+                pos += 1
+            if pos == n or is_end(buf[pos]):
+                malformed = True
+                break
+            key = 0
+            while pos < n and buf[pos] >= 48 and buf[pos] <= 57:
+                key = key * 10 + (buf[pos] - 48)
+                pos += 1
+            if pos < n and not is_end(buf[pos]):
+                malformed = True
+                break
+            # command
+            while pos < n and is_blank(buf[pos]):
+                pos += 1
+            command = 0
+            if pos < n and buf[pos] != 10:
+                command = FNV_OFFSET
+                while pos < n and not is_end(buf[pos]):
+                    c = buf[pos]
+                    if c >= 97 and c <= 122:
+                        c -= 32
+                    command = (command ^ c) * FNV_PRIME
+                    pos += 1
+            while pos < n and buf[pos] != 10:
+                pos += 1
+            pos += 1
+            keys[count] = -key if negative else key
+            timestamps[count] = <double>mantissa / scale if numeric else NAN
+            commands[count] = <int64_t>command
+            count += 1
+    if malformed:
+        raise ValueError("malformed redis trace line at byte {}: {!r}".format(line_start, bytes(data[line_start:line_start + 80]).split(b'\n')[0]))
+    return count, min(pos, n)
@@ -0,0 +1,73 @@
+import sqlite3
+
+# Sweep results as typed SQLite tables, one row per configuration, indexed by (trace, policy, size) so the
+# analysis scripts can query the slices they plot. The database runs in WAL mode with a busy timeout, so
+# several sweeps can insert into the same file while readers keep querying it. A configuration simulated
+# again (same trace, policy, sizes, sample rate and, for the multilevel table, read-only or write-aware replay)
+# replaces its previous row.
+
+SINGLE_TABLE = "single_results"
+MULTI_TABLE = "multi_results"
+
+SINGLE_COLUMNS = [('trace', 'TEXT NOT NULL'), ('policy', 'TEXT NOT NULL'), ('size', 'INTEGER NOT NULL'),
+                  ('hits', 'INTEGER'), ('misses', 'INTEGER'), ('hit_ratio', 'REAL'), ('byte_hit_ratio', 'REAL'),
+                  ('time', 'REAL'), ('sample_rate', 'REAL NOT NULL DEFAULT 1.0'), ('hit_ratio_error', 'REAL')]
+SINGLE_KEY = ['trace', 'policy', 'size', 'sample_rate']
+
+MULTI_COLUMNS = [('trace', 'TEXT NOT NULL'), ('policy', 'TEXT NOT NULL'), ('l1_size', 'INTEGER NOT NULL'), ('l2_size', 'INTEGER NOT NULL'),
+                 ('l1_hits', 'INTEGER'), ('l1_misses', 'INTEGER'), ('l1_accesses', 'INTEGER'), ('l1_writes', 'INTEGER'), ('l1_charged', 'INTEGER'), ('l1_hit_ratio', 'REAL'),
+                 ('l2_hits', 'INTEGER'), ('l2_misses', 'INTEGER'), ('l2_accesses', 'INTEGER'), ('l2_writes', 'INTEGER'), ('l2_charged', 'INTEGER'), ('l2_hit_ratio', 'REAL'),
+                 ('total_hits', 'INTEGER'), ('total_misses', 'INTEGER'), ('total_accesses', 'INTEGER'),
+                 ('remote_accesses', 'INTEGER'), ('remote_writes', 'INTEGER'), ('remote_charged', 'INTEGER'), ('total_hit_ratio', 'REAL'),
+                 ('total_byte_hit_ratio', 'REAL'), ('time', 'REAL'), ('sample_rate', 'REAL NOT NULL DEFAULT 1.0'), ('total_hit_ratio_error', 'REAL'),
+                 ('writes', 'INTEGER NOT NULL DEFAULT 0')]
+MULTI_KEY = ['trace', 'policy', 'l1_size', 'l2_size', 'sample_rate', 'writes']
+
+
+class ResultsDB(object):
+    # weighted_columns are the per-technology latency columns (REAL) of each table, e.g. FastDBDRAM or WeightedFastDB
+    def __init__(self, path, single_weighted=(), multi_weighted=()):
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.columns = {SINGLE_TABLE: [name for name, _ in SINGLE_COLUMNS] + list(single_weighted),
+                        MULTI_TABLE: [name for name, _ in MULTI_COLUMNS] + list(multi_weighted)}
+        self.create_table(SINGLE_TABLE, SINGLE_COLUMNS, single_weighted, SINGLE_KEY)
+        self.create_table(MULTI_TABLE, MULTI_COLUMNS, multi_weighted, MULTI_KEY)
+
+    def create_table(self, table, columns, weighted, key):
+        definitions = ["{} {}".format(name, kind) for name, kind in columns] + ["{} REAL".format(name) for name in weighted]
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS {} ({})".format(table, ", ".join(definitions)))
+            existing = [row['name'] for row in self.connection.execute("PRAGMA table_info({})".format(table))]
+            for name, kind in columns:
+                if name not in existing:
+                    self.connection.execute("ALTER TABLE {} ADD COLUMN {} {}".format(table, name, kind))
+            for name in weighted:
+                if name not in existing:
+                    self.connection.execute("ALTER TABLE {} ADD COLUMN {} REAL".format(table, name))
+            # databases of older sweeps are re-keyed on the columns added since
+            indexed = [row['name'] for row in self.connection.execute("PRAGMA index_info({}_key)".format(table))]
+            if indexed and indexed != key:
+                self.connection.execute("DROP INDEX {}_key".format(table))
+            self.connection.execute("CREATE UNIQUE INDEX IF NOT EXISTS {0}_key ON {0} ({1})".format(table, ", ".join(key)))
+
+    # row maps column names to values, missing columns are stored as NULL (or their default)
+    def insert(self, table, row):
+        names = [name for name in self.columns[table] if row.get(name) is not None]
+        self.connection.execute("INSERT OR REPLACE INTO {} ({}) VALUES ({})".format(table, ", ".join(names), ", ".join("?" * len(names))),
+                                [row[name] for name in names])
+
+    def commit(self):
+        self.connection.commit()
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+    def query(self, sql, parameters=()):
+        return self.connection.execute(sql, parameters).fetchall()
+
+    def traces(self, table):
+        return [row['trace'] for row in self.query("SELECT DISTINCT trace FROM {} ORDER BY trace".format(table))]
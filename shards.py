@@ -0,0 +1,134 @@
+import math
+
+import numpy as np
+
+from hierarchical import HierarchicalCache
+from opt import HierarchicalOPT
+
+# SHARDS spatial sampling (Waldspurger et al., FAST'15): a request is simulated iff hash(key) mod P < T, so
+# every key is either fully in or fully out of the sample and the sampled stream behaves like the full one
+# against a cache scaled down by R = T/P. Policies run unchanged on the sampled stream with scaled sizes and
+# their request counters are scaled back up by 1/R.
+
+SHARDS_MODULUS = 1 << 24
+BITMAP_BLOCK = 1 << 20 # hash bitmap entries scanned at a time
+TWO_LEVEL_POLICIES = (HierarchicalCache, HierarchicalOPT)
+
+
+def spatial_hash(keys):
+    # splitmix64 finalizer, vectorized over uint64 (wraps around like the C version)
+    x = np.asarray(keys, dtype=np.int64).astype(np.uint64)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    x = x ^ (x >> np.uint64(31))
+    return x & np.uint64(SHARDS_MODULUS - 1)
+
+
+# Dense traces (tracecache) are sampled by their original keys, so they sample the same keys as the plain trace
+def key_hash(trace, keys):
+    unique_keys = getattr(trace, 'unique_keys', None)
+    return spatial_hash(keys if unique_keys is None else unique_keys[keys])
+
+
+class SampledTrace(object):
+    def __init__(self, trace, threshold):
+        self.trace = trace
+        self.threshold = np.uint64(threshold)
+        # a sampled dense trace keeps the ids of the full one, so policies still index them by the full mapping
+        self.unique_keys = getattr(trace, 'unique_keys', None)
+        self.distinct = getattr(trace, 'distinct', None)
+
+    def chunks(self, chunk_size):
+        for chunk in self.trace.chunks(chunk_size):
+            keys = chunk if chunk.ndim == 1 else chunk[:, 0]
+            sampled = chunk[key_hash(self.trace, keys) < self.threshold]
+            if len(sampled) > 0:
+                yield sampled
+
+    def __iter__(self):
+        for chunk in self.chunks(1 << 16):
+            yield from chunk.tolist()
+
+
+# Fixed-rate SHARDS: a constant threshold T = R*P
+class FixedRateSampler(object):
+    def __init__(self, rate):
+        self.threshold = min(SHARDS_MODULUS, max(1, round(rate * SHARDS_MODULUS)))
+        self.rate = self.threshold / SHARDS_MODULUS
+        self.sampled_keys = 0
+
+    def get_name(self):
+        return "FixedRate({})".format(self.rate)
+
+    # One vectorized pass that marks the sampled hashes in a bitmap of T entries. sampled_keys, used by the error
+    # estimate, counts the distinct 24-bit hashes below T, keys whose hashes collide are counted once.
+    def prepare(self, trace, chunk_size=1 << 16):
+        seen = np.zeros(self.threshold, dtype=bool)
+        for chunk in trace.chunks(chunk_size):
+            hashes = key_hash(trace, chunk if chunk.ndim == 1 else chunk[:, 0])
+            seen[hashes[hashes < np.uint64(self.threshold)]] = True
+        self.sampled_keys = int(np.count_nonzero(seen))
+
+    def sample(self, trace):
+        return SampledTrace(trace, self.threshold)
+
+    def scale_size(self, size):
+        return max(1, round(size * self.rate))
+
+    def scale(self, policy):
+        if isinstance(policy, TWO_LEVEL_POLICIES):
+            return policy.resized(self.scale_size(policy.l1_maximum_size), self.scale_size(policy.l2_maximum_size))
+        return policy.resized(self.scale_size(policy.maximum_size))
+
+    # Standard error of the hit ratio, treating every sampled hash as an independent draw
+    def hit_ratio_error(self, hit_ratio):
+        return math.sqrt(hit_ratio * (1 - hit_ratio) / max(1, self.sampled_keys))
+
+    # Reports the results of a scaled policy as if it ran on the full trace with the original sizes
+    def unscale(self, results, policy):
+        results = dict(results)
+        if isinstance(policy, TWO_LEVEL_POLICIES):
+            for name, value in results.items():
+                if name.endswith(('_hits', '_misses', '_accesses', '_writes', '_charged')):
+                    results[name] = round(value / self.rate)
+            results['l1_size'] = policy.l1_maximum_size
+            results['l2_size'] = policy.l2_maximum_size
+            results['sample_rate'] = self.rate
+            results['total_hit_ratio_error'] = self.hit_ratio_error(results['total_hit_ratio'])
+        else:
+            for name in ['hits', 'misses', 'byte hits', 'byte misses']:
+                if name in results:
+                    results[name] = round(results[name] / self.rate)
+            results['size'] = policy.maximum_size
+            results['sample rate'] = self.rate
+            results['hit ratio error'] = self.hit_ratio_error(results['hit ratio'])
+        return results
+
+
+# Fixed-size SHARDS: keeps at most maximum_keys sampled hashes. The original lowers T on the fly while the
+# stack is built; since whole policies are replayed here, a first pass marks every hash in a bitmap of the whole
+# modulus, T is the (maximum_keys + 1)-th smallest hash present and the trace is then sampled at that fixed rate.
+class FixedSizeSampler(FixedRateSampler):
+    def __init__(self, maximum_keys):
+        super().__init__(1.0)
+        self.maximum_keys = maximum_keys
+
+    def get_name(self):
+        return "FixedSize({})".format(self.maximum_keys)
+
+    def prepare(self, trace, chunk_size=1 << 16):
+        seen = np.zeros(SHARDS_MODULUS, dtype=bool)
+        for chunk in trace.chunks(chunk_size):
+            seen[key_hash(trace, chunk if chunk.ndim == 1 else chunk[:, 0])] = True
+        self.threshold = SHARDS_MODULUS
+        counted = 0
+        for start in range(0, SHARDS_MODULUS, BITMAP_BLOCK):
+            block = seen[start:start + BITMAP_BLOCK]
+            present = int(np.count_nonzero(block))
+            if counted + present > self.maximum_keys:
+                self.threshold = start + int(np.flatnonzero(block)[self.maximum_keys - counted])
+                counted = self.maximum_keys
+                break
+            counted += present
+        self.rate = self.threshold / SHARDS_MODULUS
+        self.sampled_keys = counted
@@ -1,5 +1,7 @@
+from array import array
 from enum import Enum, auto
 from collections import Counter
+from heapq import heapify, heappop, heappush
 from math import log
 from scipy import stats
 from sortedcontainers import SortedDict
@@ -9,17 +11,38 @@ class Policy(object):
         self.maximum_size = maximum_size
         self.misses = 0
         self.hits = 0
+        self.byte_misses = 0
+        self.byte_hits = 0
         pass
     def reset(self):
         self.misses = 0
         self.hits = 0
+        self.byte_misses = 0
+        self.byte_hits = 0
         pass
     def record(self, key, size=1):
         pass
+    def record_many(self, keys, sizes=None):
+        record = self.record
+        if sizes is None:
+            for key in keys.tolist():
+                record(key)
+        else:
+            for key, size in zip(keys.tolist(), sizes.tolist()):
+                record(key, size)
     def get_stats(self):
-        return {'name' : self.__class__.__name__, 'size' : self.maximum_size, 'hits' : self.hits, 'misses' : self.misses, 'hit ratio' : self.hits / (self.hits + self.misses) }
+        return {'name' : self.__class__.__name__, 'size' : self.maximum_size, 'hits' : self.hits, 'misses' : self.misses, 'hit ratio' : self.hits / max(1, self.hits + self.misses),
+                'byte hits' : self.byte_hits, 'byte misses' : self.byte_misses, 'byte hit ratio' : self.byte_hits / max(1, self.byte_hits + self.byte_misses) }
     def get_name(self):
         return self.__class__.__name__
+    def get_params(self):
+        return {'maximum_size' : self.maximum_size}
+    # The same policy with another capacity (SHARDS scaling), subclasses with more parameters keep them
+    def resized(self, maximum_size):
+        return self.__class__(maximum_size)
+    # Called after reset() when the keys are dense ids (tracecache), policies indexing keys by arrays switch to them
+    def use_dense_keys(self, unique_keys):
+        pass
 
 
 class LRU(Policy):
@@ -39,10 +62,12 @@ class LRU(Policy):
         node = self.data.get(key)
         if node:
             self.hits += 1
+            self.byte_hits += size
             node.remove()
             node.append_to_tail(self.sentinel)
         else:
             self.misses += 1
+            self.byte_misses += size
             if size > self.maximum_size:
                 return
             self.current_size += size
@@ -54,6 +79,264 @@ class LRU(Policy):
             new_node.append_to_tail(self.sentinel)
             self.data[key] = new_node
 
+    # record() inlined over a block of requests, counters are updated once per block
+    def record_many(self, keys, sizes=None):
+        if self.maximum_size < 1:
+            return super().record_many(keys, sizes)
+        if sizes is not None:
+            return self.record_many_sized(keys, sizes)
+        data = self.data
+        sentinel = self.sentinel
+        maximum_size = self.maximum_size
+        current_size = self.current_size
+        hits = 0
+        keys = keys.tolist()
+        for key in keys:
+            node = data.get(key)
+            if node:
+                hits += 1
+                node.remove()
+                node.append_to_tail(sentinel)
+            else:
+                current_size += 1
+                while (current_size > maximum_size):
+                    victim = sentinel.next_node
+                    del data[victim.data]
+                    current_size -= victim.size
+                    victim.remove()
+                new_node = Node(key)
+                new_node.append_to_tail(sentinel)
+                data[key] = new_node
+        self.current_size = current_size
+        self.hits += hits
+        self.misses += len(keys) - hits
+        self.byte_hits += hits
+        self.byte_misses += len(keys) - hits
+
+    # Byte capacity: one insertion may push out several victims, they are unlinked from the head in a single loop
+    def record_many_sized(self, keys, sizes):
+        data = self.data
+        sentinel = self.sentinel
+        maximum_size = self.maximum_size
+        current_size = self.current_size
+        hits = 0
+        byte_hits = 0
+        byte_misses = 0
+        for key, size in zip(keys.tolist(), sizes.tolist()):
+            node = data.get(key)
+            if node:
+                hits += 1
+                byte_hits += size
+                node.remove()
+                node.append_to_tail(sentinel)
+            else:
+                byte_misses += size
+                if size > maximum_size:
+                    continue
+                current_size += size
+                if current_size > maximum_size:
+                    victim = sentinel.next_node
+                    while current_size > maximum_size:
+                        del data[victim.data]
+                        current_size -= victim.size
+                        victim = victim.next_node
+                    sentinel.next_node = victim
+                    victim.prev_node = sentinel
+                new_node = Node(key, size=size)
+                new_node.append_to_tail(sentinel)
+                data[key] = new_node
+        self.current_size = current_size
+        self.hits += hits
+        self.misses += len(keys) - hits
+        self.byte_hits += byte_hits
+        self.byte_misses += byte_misses
+
+
+# Same replacement order as LRU, but the recency list lives in preallocated int64 slot arrays linked by
+# slot index instead of one Node object per key. Slot 0 is the sentinel, freed slots are chained through next_slot.
+# The slot arrays are only allocated by reset(), which run() calls first, so that the grid of configurations
+# built (and pickled to the workers) before the sweep stays small.
+class ArrayLRU(Policy):
+    def __init__(self, maximum_size):
+        super().__init__(maximum_size)
+        self.distinct = None
+        self.current_size = 0
+        self.slots = {}
+        self.prev_slot = array('q')
+        self.next_slot = array('q')
+        self.key_slot = array('q')
+        self.size_slot = array('q')
+        self.free_head = 0
+        self.unused = 1
+
+    def reset(self):
+        super().reset()
+        self.reset_slots()
+
+    def reset_slots(self):
+        self.current_size = 0
+        self.slots = {} if self.distinct is None else array('q', bytes(8 * self.distinct))
+        empty = bytes(8 * (self.maximum_size + 1))
+        self.prev_slot = array('q', empty)
+        self.next_slot = array('q', empty)
+        self.key_slot = array('q', empty)
+        self.size_slot = array('q', empty)
+        self.free_head = 0
+        self.unused = 1
+
+    def record(self, key, size=1):
+        prev_slot = self.prev_slot
+        next_slot = self.next_slot
+        slot = self.slots.get(key)
+        if slot is not None:
+            self.hits += 1
+            self.byte_hits += size
+            prev = prev_slot[slot]
+            nxt = next_slot[slot]
+            next_slot[prev] = nxt
+            prev_slot[nxt] = prev
+        else:
+            self.misses += 1
+            self.byte_misses += size
+            if size > self.maximum_size:
+                return
+            self.current_size += size
+            while (self.current_size > self.maximum_size):
+                victim = next_slot[0]
+                del self.slots[self.key_slot[victim]]
+                self.current_size -= self.size_slot[victim]
+                nxt = next_slot[victim]
+                next_slot[0] = nxt
+                prev_slot[nxt] = 0
+                next_slot[victim] = self.free_head
+                self.free_head = victim
+            if self.free_head:
+                slot = self.free_head
+                self.free_head = next_slot[slot]
+            else:
+                slot = self.unused
+                self.unused += 1
+            self.key_slot[slot] = key
+            self.size_slot[slot] = size
+            self.slots[key] = slot
+        tail = prev_slot[0]
+        prev_slot[slot] = tail
+        next_slot[slot] = 0
+        next_slot[tail] = slot
+        prev_slot[0] = slot
+
+    # record() inlined over a block of unit-size requests, like LRU.record_many. Hashed keys still need the slots
+    # dict, dense ones (use_dense_keys) index the flat slot array instead.
+    def record_many(self, keys, sizes=None):
+        if self.maximum_size < 1 or sizes is not None:
+            return super().record_many(keys, sizes)
+        dense = self.distinct is not None
+        slots = self.slots
+        prev_slot = self.prev_slot
+        next_slot = self.next_slot
+        key_slot = self.key_slot
+        size_slot = self.size_slot
+        maximum_size = self.maximum_size
+        current_size = self.current_size
+        free_head = self.free_head
+        unused = self.unused
+        hits = 0
+        keys = keys.tolist()
+        for key in keys:
+            slot = slots[key] if dense else slots.get(key)
+            if slot:
+                hits += 1
+                tail = prev_slot[0]
+                if slot == tail: # already the most recent
+                    continue
+                prev = prev_slot[slot]
+                nxt = next_slot[slot]
+                next_slot[prev] = nxt
+                prev_slot[nxt] = prev
+            else:
+                current_size += 1
+                while (current_size > maximum_size):
+                    victim = next_slot[0]
+                    if dense:
+                        slots[key_slot[victim]] = 0
+                    else:
+                        del slots[key_slot[victim]]
+                    current_size -= size_slot[victim]
+                    nxt = next_slot[victim]
+                    next_slot[0] = nxt
+                    prev_slot[nxt] = 0
+                    next_slot[victim] = free_head
+                    free_head = victim
+                if free_head:
+                    slot = free_head
+                    free_head = next_slot[slot]
+                else:
+                    slot = unused
+                    unused += 1
+                key_slot[slot] = key
+                size_slot[slot] = 1
+                slots[key] = slot
+                tail = prev_slot[0]
+            prev_slot[slot] = tail
+            next_slot[slot] = 0
+            next_slot[tail] = slot
+            prev_slot[0] = slot
+        self.current_size = current_size
+        self.free_head = free_head
+        self.unused = unused
+        self.hits += hits
+        self.misses += len(keys) - hits
+        self.byte_hits += hits
+        self.byte_misses += len(keys) - hits
+
+    # With dense keys the slot of every key is kept in a flat array, 0 (the sentinel) when it is not resident
+    def use_dense_keys(self, unique_keys):
+        self.distinct = len(unique_keys)
+        self.reset_slots()
+        self.record = self.record_dense
+
+    def record_dense(self, key, size=1):
+        prev_slot = self.prev_slot
+        next_slot = self.next_slot
+        slots = self.slots
+        slot = slots[key]
+        if slot:
+            self.hits += 1
+            self.byte_hits += size
+            prev = prev_slot[slot]
+            nxt = next_slot[slot]
+            next_slot[prev] = nxt
+            prev_slot[nxt] = prev
+        else:
+            self.misses += 1
+            self.byte_misses += size
+            if size > self.maximum_size:
+                return
+            self.current_size += size
+            while (self.current_size > self.maximum_size):
+                victim = next_slot[0]
+                slots[self.key_slot[victim]] = 0
+                self.current_size -= self.size_slot[victim]
+                nxt = next_slot[victim]
+                next_slot[0] = nxt
+                prev_slot[nxt] = 0
+                next_slot[victim] = self.free_head
+                self.free_head = victim
+            if self.free_head:
+                slot = self.free_head
+                self.free_head = next_slot[slot]
+            else:
+                slot = self.unused
+                self.unused += 1
+            self.key_slot[slot] = key
+            self.size_slot[slot] = size
+            slots[key] = slot
+        tail = prev_slot[0]
+        prev_slot[slot] = tail
+        next_slot[slot] = 0
+        next_slot[tail] = slot
+        prev_slot[0] = slot
+
 
 class Node(object):
     def __init__(self, data=None, size=1, status=None):
@@ -94,6 +377,7 @@ class LFU(Policy):
         node = self.items.get(key)
         if node:
             self.hits += 1
+            self.byte_hits += size
             item = self.items[key]
             lfuid = item[0]
             newlfuid = (lfuid[0]+1,lfuid[1])
@@ -102,6 +386,7 @@ class LFU(Policy):
             self.items[key] = (newlfuid,item[1])
         else:
             self.misses += 1
+            self.byte_misses += size
             if size > self.maximum_size:
                 return
             self.current_size += size
@@ -114,3 +399,88 @@ class LFU(Policy):
             self.lfuq[lfuid] = key
 
 
+
+
+# Same victims as LFU (lowest count, then oldest insertion) without the SortedDict. Keys are grouped into one
+# bucket per count and the buckets form a doubly linked list in count order (lower/higher, 0 is the sentinel),
+# so the least frequent bucket and a promotion target are found in O(1). Within a bucket the oldest insertion
+# is kept on top of a small heap of (insertion, key); promoted keys leave a stale entry behind that is skipped
+# when popped and dropped when the heap is compacted.
+class BucketLFU(Policy):
+    def __init__(self, maximum_size):
+        super().__init__(maximum_size)
+        self.reset_buckets()
+
+    def reset(self):
+        super().reset()
+        self.reset_buckets()
+
+    def reset_buckets(self):
+        self.current_size = 0
+        self.items = {}
+        self.buckets = {}
+        self.live = {}
+        self.lower = {0: 0}
+        self.higher = {0: 0}
+
+    def add_to_bucket(self, count, after, seq, key):
+        if count not in self.buckets:
+            self.buckets[count] = []
+            self.live[count] = 0
+            self.lower[count] = after
+            self.higher[count] = self.higher[after]
+            self.lower[self.higher[after]] = count
+            self.higher[after] = count
+        heap = self.buckets[count]
+        heappush(heap, (seq, key))
+        self.live[count] += 1
+        if len(heap) > 2 * self.live[count] + 64:
+            self.compact(count)
+
+    def remove_from_bucket(self, count):
+        self.live[count] -= 1
+        if self.live[count] == 0:
+            del self.buckets[count]
+            del self.live[count]
+            self.higher[self.lower[count]] = self.higher[count]
+            self.lower[self.higher[count]] = self.lower[count]
+            del self.lower[count]
+            del self.higher[count]
+
+    def is_current(self, count, seq, key):
+        item = self.items.get(key)
+        return item is not None and item[0] == count and item[1] == seq
+
+    def compact(self, count):
+        heap = [(seq, key) for (seq, key) in self.buckets[count] if self.is_current(count, seq, key)]
+        heapify(heap)
+        self.buckets[count] = heap
+
+    def evict(self):
+        count = self.higher[0]
+        heap = self.buckets[count]
+        seq, key = heappop(heap)
+        while not self.is_current(count, seq, key):
+            seq, key = heappop(heap)
+        self.current_size -= self.items.pop(key)[2]
+        self.remove_from_bucket(count)
+
+    def record(self, key, size=1):
+        item = self.items.get(key)
+        if item:
+            self.hits += 1
+            self.byte_hits += size
+            count = item[0]
+            item[0] = count + 1
+            self.add_to_bucket(count + 1, count, item[1], key)
+            self.remove_from_bucket(count)
+        else:
+            self.misses += 1
+            self.byte_misses += size
+            if size > self.maximum_size:
+                return
+            self.current_size += size
+            while (self.current_size > self.maximum_size):
+                self.evict()
+            self.items[key] = [1, self.misses, size]
+            self.add_to_bucket(1, 0, self.misses, key)
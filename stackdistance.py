@@ -0,0 +1,211 @@
+from collections import OrderedDict, defaultdict
+from itertools import accumulate
+
+import numpy as np
+
+# LRU is a stack algorithm: a request hits in an LRU of size C iff its reuse (stack) distance is at most C.
+# A single pass that histograms the stack distance of every request therefore yields the exact LRU hit
+# count of every cache size at once.
+# The distance of a request is the number of distinct keys accessed since the previous access to the same
+# key (itself included). It is computed with a Fenwick tree over access times in which only the most recent
+# access of every key is marked, so each request costs O(log n). Dense traces (tracecache) index the last
+# accesses by key id instead of hashing the keys.
+
+
+class StackDistance(object):
+    def __init__(self, trace):
+        self.histogram = [0]
+        self.cold_misses = 0
+        self.accesses = 0
+        self.cumulative = [0]
+        self.process(trace)
+
+    def process(self, trace):
+        keys = trace if hasattr(trace, '__len__') else list(trace)
+        n = len(keys)
+        tree = [0] * (n + 1)
+        histogram = [0] * (n + 1)
+        distinct = getattr(trace, 'distinct', None)
+        last_access = [0] * distinct if distinct is not None else defaultdict(int)
+        cold_misses = 0
+        marked = 0
+        for t, key in enumerate(keys, 1):
+            p = last_access[key]
+            if p == 0:
+                cold_misses += 1
+            else:
+                # the distance is the number of keys whose last access is at p or later
+                above = 0
+                i = p - 1
+                while i > 0:
+                    above += tree[i]
+                    i &= i - 1
+                histogram[marked - above] += 1
+                i = p
+                while i <= n:
+                    tree[i] -= 1
+                    i += i & -i
+                marked -= 1
+            last_access[key] = t
+            i = t
+            while i <= n:
+                tree[i] += 1
+                i += i & -i
+            marked += 1
+        self.histogram = histogram
+        self.cold_misses = cold_misses
+        self.accesses = n
+        self.cumulative = list(accumulate(histogram))
+
+    def hits(self, size):
+        if size <= 0:
+            return 0
+        return self.cumulative[min(size, len(self.cumulative) - 1)]
+
+    # Same dictionary as simplepolicies.LRU(size).get_stats() after replaying the trace
+    def lru_stats(self, size):
+        hits = self.hits(size)
+        misses = self.accesses - hits
+        return {'name': 'LRU', 'size': size, 'hits': hits, 'misses': misses, 'hit ratio': hits / max(1, hits + misses),
+                'byte hits': hits, 'byte misses': misses, 'byte hit ratio': hits / max(1, hits + misses)}
+
+
+# HierarchicalCache with LLRU levels, evaluated for many (l1 size, l2 size) splits in one pass over a read-only
+# trace of unit-size keys. L1 receives every request, so it is exactly LRU(l1 size) and all of its columns come
+# from the stack distance histogram. L2 only sees L1 misses: a probe for the requested key followed by the
+# write-back of the L1 victim, which is the key at depth l1 size of the global LRU stack. One pointer per L1 size
+# follows that depth through a linked list of the stack, so only the L2 of every split has to be replayed, and
+# only on its L1 misses. An L2 at least as large as the number of distinct keys never evicts: every non-cold L1
+# miss hits there and it writes every key that ever fell below L1, which needs no replay at all.
+class SplitStackDistance(object):
+    def __init__(self, trace, splits):
+        self.splits = sorted(set(splits))
+        self.results = {}
+        self.process(trace)
+
+    def process(self, trace):
+        keys = np.concatenate([chunk if chunk.ndim == 1 else chunk[:, 0] for chunk in trace.chunks(1 << 16)] or [np.empty(0, dtype=np.int64)])
+        distinct = getattr(trace, 'distinct', None)
+        if distinct is None:
+            keys = np.unique(keys, return_inverse=True)[1].reshape(-1)
+        else:
+            # the ids of a sampled dense trace have gaps, renumber the ones that occur
+            present = np.zeros(distinct, dtype=np.int64)
+            present[keys] = 1
+            keys = (np.cumsum(present) - 1)[keys]
+        keys = keys.tolist()
+        n = len(keys)
+        distinct = max(keys) + 1 if keys else 0
+        l1_sizes = sorted(set(l1_size for l1_size, l2_size in self.splits))
+        replayed = [(l1_size, l2_size) for l1_size, l2_size in self.splits if l2_size < distinct]
+        # per L1 size: the key at that depth (-1 until the stack is that deep) and the L2s replayed behind it
+        depth_keys = [-1] * len(l1_sizes)
+        l2_caches = [[(i, OrderedDict(), l2_size) for i, (l1_size, l2_size) in enumerate(replayed) if l1_size == size] for size in l1_sizes]
+        l2_hits = [0] * len(replayed)
+        l2_writes = [0] * len(replayed)
+        # global LRU stack as a doubly linked list over dense key ids, slot `distinct` is the sentinel
+        head = distinct
+        prev_key = [head] * (distinct + 1)
+        next_key = [head] * (distinct + 1)
+        tree = [0] * (n + 1)
+        histogram = [0] * (n + 2)
+        last_access = [0] * distinct
+        lowest = [0] * distinct # deepest position every key reached in the stack
+        marked = 0
+        for t, key in enumerate(keys, 1):
+            p = last_access[key]
+            if p == 0:
+                depth = n + 1
+            else:
+                above = 0
+                i = p - 1
+                while i > 0:
+                    above += tree[i]
+                    i &= i - 1
+                depth = marked - above
+                if depth > lowest[key]:
+                    lowest[key] = depth
+                i = p
+                while i <= n:
+                    tree[i] -= 1
+                    i += i & -i
+                marked -= 1
+            histogram[depth] += 1
+            # move the L1 depth pointers before the stack changes
+            for j, l1_size in enumerate(l1_sizes):
+                if l1_size > depth:
+                    break
+                victim = depth_keys[j]
+                if l1_size < depth and victim >= 0: # an L1 miss that evicts, L2 is probed and gets the victim
+                    for c, l2, l2_size in l2_caches[j]:
+                        if key in l2:
+                            l2.move_to_end(key)
+                            l2_hits[c] += 1
+                        if victim in l2:
+                            l2.move_to_end(victim)
+                        else:
+                            l2[victim] = None
+                            l2_writes[c] += 1
+                            if len(l2) > l2_size:
+                                l2.popitem(last=False)
+                elif l1_size < depth: # L1 is still filling up, L2 is only probed
+                    for c, l2, l2_size in l2_caches[j]:
+                        if key in l2:
+                            l2.move_to_end(key)
+                            l2_hits[c] += 1
+                if victim >= 0:
+                    depth_keys[j] = key if l1_size == 1 else prev_key[victim]
+            if p != 0:
+                next_key[prev_key[key]] = next_key[key]
+                prev_key[next_key[key]] = prev_key[key]
+            next_key[key] = next_key[head]
+            prev_key[key] = head
+            prev_key[next_key[head]] = key
+            next_key[head] = key
+            if p == 0:
+                # the stack just became one key deeper, its bottom is at that depth
+                for j, l1_size in enumerate(l1_sizes):
+                    if l1_size == marked + 1:
+                        depth_keys[j] = prev_key[head]
+            last_access[key] = t
+            i = t
+            while i <= n:
+                tree[i] += 1
+                i += i & -i
+            marked += 1
+        # keys still in the stack at the end reached at least their final depth
+        key = next_key[head]
+        depth = 1
+        while key != head:
+            if depth > lowest[key]:
+                lowest[key] = depth
+            key = next_key[key]
+            depth += 1
+        cumulative = list(accumulate(histogram))
+        fallen = list(accumulate(np.bincount(lowest, minlength=n + 2).tolist())) if distinct else [0] * (n + 2)
+        cold_misses = distinct
+        replayed_index = {split: i for i, split in enumerate(replayed)}
+        for l1_size, l2_size in self.splits:
+            l1_hits = cumulative[min(l1_size, n)] if l1_size > 0 else 0
+            l1_misses = n - l1_hits
+            if (l1_size, l2_size) in replayed_index:
+                c = replayed_index[(l1_size, l2_size)]
+                hits2, writes2 = l2_hits[c], l2_writes[c]
+            else:
+                hits2, writes2 = l1_misses - cold_misses, distinct - fallen[min(l1_size, n)]
+            self.results[(l1_size, l2_size)] = self.stats(n, l1_size, l2_size, l1_hits, hits2, writes2)
+
+    # Same dictionary as HierarchicalCache(l1_size, l2_size).get_stats() after replaying the trace
+    def stats(self, n, l1_size, l2_size, l1_hits, l2_hits, l2_writes):
+        l1_misses = n - l1_hits
+        total_hits = l1_hits + l2_hits
+        total_misses = n - total_hits
+        return {'name': 'HierarchicalCache', 'l1_size': l1_size, 'l2_size': l2_size,
+                'l1_hits': l1_hits, 'l1_misses': l1_misses, 'l1_accesses': n, 'l1_writes': l1_misses, 'l1_charged': n, 'l1_hit_ratio': l1_hits / max(1, n),
+                'l2_hits': l2_hits, 'l2_misses': l1_misses - l2_hits, 'l2_accesses': l1_misses, 'l2_writes': l2_writes, 'l2_charged': l2_hits, 'l2_hit_ratio': l2_hits / max(1, l1_misses),
+                'total_hits': total_hits, 'total_misses': total_misses, 'total_accesses': n,
+                'remote_accesses': total_misses, 'remote_writes': 0, 'remote_charged': total_misses, 'total_hit_ratio': total_hits / max(1, n),
+                'total_byte_hits': total_hits, 'total_byte_misses': total_misses, 'total_byte_hit_ratio': total_hits / max(1, n)}
+
+    def split_stats(self, l1_size, l2_size):
+        return self.results[(l1_size, l2_size)]
@@ -0,0 +1,69 @@
+import numpy as np
+
+# Counters of a replay sampled every `window` requests. The replayed chunks are cut at the window boundaries
+# and the cumulative counters of the policy (its get_stats) are read once per window into a preallocated
+# array, so the requests themselves pay nothing; the per-window values are the differences of the readings.
+# Gauges are policy attributes read as they are at the end of each window, e.g. the window size of the
+# WC/WI W-TinyLFU climbers, and are -1 for policies that do not have them.
+
+SINGLE_COUNTERS = ['hits', 'misses']
+SINGLE_BYTE_COUNTERS = ['byte hits', 'byte misses']
+MULTI_COUNTERS = ['total_hits', 'total_misses', 'l1_hits', 'l2_hits', 'remote_accesses', 'l1_charged', 'l2_charged', 'remote_charged', 'l2_writes', 'remote_writes']
+MULTI_BYTE_COUNTERS = ['total_byte_hits', 'total_byte_misses']
+GAUGES = ['max_window_size']
+
+
+class WindowedCounters(object):
+    def __init__(self, window, counters, gauges=GAUGES, capacity=1024):
+        self.window = window
+        self.counters = list(counters)
+        self.gauges = list(gauges)
+        self.readings = np.zeros((capacity, 1 + len(self.counters) + len(self.gauges)), dtype=np.int64)
+        self.length = 0
+        self.requests = 0
+
+    def reset(self):
+        self.length = 0
+        self.requests = 0
+
+    # Yields the chunks cut at the window boundaries, reading the policy after every window it completed
+    def windows(self, chunks, policy):
+        filled = self.requests % self.window
+        for chunk in chunks:
+            start = 0
+            while start < len(chunk):
+                end = min(len(chunk), start + self.window - filled)
+                yield chunk[start:end]
+                self.requests += end - start
+                filled += end - start
+                start = end
+                if filled == self.window:
+                    self.read(policy)
+                    filled = 0
+
+    # Reads a last, partial window
+    def finish(self, policy):
+        if self.requests % self.window:
+            self.read(policy)
+
+    def read(self, policy):
+        if self.length == len(self.readings):
+            self.readings = np.concatenate([self.readings, np.zeros_like(self.readings)])
+        stats = policy.get_stats()
+        row = self.readings[self.length]
+        row[0] = self.requests
+        for i, name in enumerate(self.counters):
+            row[1 + i] = stats.get(name, 0)
+        for i, name in enumerate(self.gauges):
+            row[1 + len(self.counters) + i] = getattr(policy, name, -1)
+        self.length += 1
+
+    # One row per window: [requests, counters..., gauges...], counters are per window and not cumulative
+    def get_series(self):
+        readings = self.readings[:self.length]
+        series = readings.copy()
+        series[1:, :1 + len(self.counters)] -= readings[:-1, :1 + len(self.counters)]
+        return series.tolist()
+
+    def get_columns(self):
+        return ['requests'] + self.counters + self.gauges
@@ -0,0 +1,156 @@
+import hashlib
+import os
+
+import numpy as np
+
+# Parsed traces are stored as raw little-endian int64 columns so that every policy after the first
+# (and every later run) replays a memory-mapped array instead of re-parsing the text trace.
+# An entry is keyed by the source path, its mtime/size and the parser class, so editing a trace
+# or parsing it differently produces a new entry.
+# A dense entry replaces the keys by ids 0..U-1 (in key order) and keeps the mapping back to the keys, whose
+# length is the number U of distinct keys, so that policies can index residency by flat arrays.
+
+KEYS_COLUMN = "keys"
+SIZES_COLUMN = "sizes"
+OPS_COLUMN = "ops"
+DENSE_COLUMN = "dense"
+UNIQUE_COLUMN = "unique"
+COLUMN_DTYPE = np.dtype('<i8')
+CONVERT_BLOCK = 1 << 20  # items buffered in memory while converting
+ITER_BLOCK = 1 << 16  # items materialized as python ints while iterating
+
+
+class MappedTrace(object):
+    def __init__(self, keys, sizes=None, ops=None, unique_keys=None):
+        self.keys = keys
+        self.sizes = sizes
+        self.ops = ops
+        self.unique_keys = unique_keys # dense traces only: the key of every id
+        self.distinct = None if unique_keys is None else len(unique_keys)
+
+    def __len__(self):
+        return len(self.keys)
+
+    # Yields exactly what the source parser yielded: plain keys, (key, size) or (key, size, op) tuples
+    def __iter__(self):
+        for start in range(0, len(self.keys), ITER_BLOCK):
+            end = start + ITER_BLOCK
+            keys = self.keys[start:end].tolist()
+            if self.sizes is None:
+                yield from keys
+            elif self.ops is None:
+                yield from zip(keys, self.sizes[start:end].tolist())
+            else:
+                yield from zip(keys, self.sizes[start:end].tolist(), self.ops[start:end].tolist())
+
+    # Same layout as parsers.Parser.chunks, plain traces are handed out as zero-copy slices of the mapping
+    def chunks(self, chunk_size):
+        for start in range(0, len(self.keys), chunk_size):
+            end = start + chunk_size
+            if self.sizes is None:
+                yield self.keys[start:end]
+            elif self.ops is None:
+                yield np.column_stack((self.keys[start:end], self.sizes[start:end]))
+            else:
+                yield np.column_stack((self.keys[start:end], self.sizes[start:end], self.ops[start:end]))
+
+
+class TraceCache(object):
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def entry_path(self, file_path, parser_class):
+        return self.named_entry_path(file_path, parser_class.__name__)
+
+    def named_entry_path(self, file_path, name):
+        stat = os.stat(file_path)
+        fingerprint = "{}|{}|{}|{}".format(os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size, name)
+        digest = hashlib.sha1(fingerprint.encode()).hexdigest()[:16]
+        return os.path.join(self.cache_dir, "{}.{}.{}".format(os.path.basename(file_path), name, digest))
+
+    def column_path(self, entry, column):
+        return "{}.{}.bin".format(entry, column)
+
+    # Hash of the trace bytes, so a configuration is recognized across runs even if the file was touched or moved.
+    # Memoized in the cache directory under the same path/mtime/size key as the parsed columns.
+    def content_digest(self, file_path):
+        digest_path = None
+        if self.cache_dir:
+            digest_path = self.named_entry_path(file_path, "content") + ".sha1"
+            if os.path.exists(digest_path):
+                with open(digest_path) as f:
+                    return f.read().strip()
+        content = hashlib.sha1()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(CONVERT_BLOCK), b''):
+                content.update(block)
+        digest = content.hexdigest()
+        if digest_path is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = digest_path + ".{}.tmp".format(os.getpid())
+            with open(tmp_path, 'w') as f:
+                f.write(digest)
+            os.replace(tmp_path, digest_path)
+        return digest
+
+    def contains(self, file_path, parser_class):
+        return os.path.exists(self.column_path(self.entry_path(file_path, parser_class), KEYS_COLUMN))
+
+    def convert(self, file_path, parser_class):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entry = self.entry_path(file_path, parser_class)
+        tmp_suffix = ".{}.tmp".format(os.getpid())
+        columns = None
+        files = []
+        for chunk in parser_class(file_path).chunks(CONVERT_BLOCK):
+            columns, files = self.write_block(entry, tmp_suffix, chunk, columns, files)
+        if columns is None:
+            columns, files = self.write_block(entry, tmp_suffix, np.empty(0, dtype=COLUMN_DTYPE), columns, files)
+        for f in files:
+            f.close()
+        # the keys column is published last, its presence marks a complete entry
+        for column in reversed(columns):
+            os.replace(self.column_path(entry, column) + tmp_suffix, self.column_path(entry, column))
+        return entry
+
+    # Publishes an already written keys column (e.g. by tracegen) as the parsed entry of a complete plain trace
+    def publish_keys(self, file_path, parser_class, keys_path):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        os.replace(keys_path, self.column_path(self.entry_path(file_path, parser_class), KEYS_COLUMN))
+
+    # A chunk as handed out by Parser.chunks: 1-D keys, or one row per request with a column per field
+    def write_block(self, entry, tmp_suffix, chunk, columns, files):
+        if columns is None:
+            columns = [KEYS_COLUMN, SIZES_COLUMN, OPS_COLUMN][:1 if chunk.ndim == 1 else chunk.shape[1]]
+            files = [open(self.column_path(entry, column) + tmp_suffix, 'wb') for column in columns]
+        data = chunk.astype(COLUMN_DTYPE, copy=False).reshape(len(chunk), len(columns))
+        for i, f in enumerate(files):
+            data[:, i].tofile(f)
+        return columns, files
+
+    def load_column(self, entry, column):
+        path = self.column_path(entry, column)
+        if not os.path.exists(path):
+            return None
+        if os.path.getsize(path) == 0:
+            return np.empty(0, dtype=COLUMN_DTYPE)
+        return np.memmap(path, dtype=COLUMN_DTYPE, mode='r')
+
+    # One vectorized pass over the keys column, the ids column is published last
+    def densify(self, entry):
+        unique_keys, dense = np.unique(self.load_column(entry, KEYS_COLUMN), return_inverse=True)
+        tmp_suffix = ".{}.tmp".format(os.getpid())
+        for column, data in [(UNIQUE_COLUMN, unique_keys), (DENSE_COLUMN, dense.reshape(-1))]:
+            data.astype(COLUMN_DTYPE).tofile(self.column_path(entry, column) + tmp_suffix)
+            os.replace(self.column_path(entry, column) + tmp_suffix, self.column_path(entry, column))
+
+    def load(self, file_path, parser_class, dense=False):
+        entry = self.entry_path(file_path, parser_class)
+        if not os.path.exists(self.column_path(entry, KEYS_COLUMN)):
+            self.convert(file_path, parser_class)
+        if not dense:
+            return MappedTrace(self.load_column(entry, KEYS_COLUMN), self.load_column(entry, SIZES_COLUMN), self.load_column(entry, OPS_COLUMN))
+        if not os.path.exists(self.column_path(entry, DENSE_COLUMN)):
+            self.densify(entry)
+        return MappedTrace(self.load_column(entry, DENSE_COLUMN), self.load_column(entry, SIZES_COLUMN), self.load_column(entry, OPS_COLUMN),
+                           self.load_column(entry, UNIQUE_COLUMN))
@@ -0,0 +1,136 @@
+import argparse
+import os
+
+import numpy as np
+
+from parsers import LirsParser
+from tracecache import TraceCache
+
+# Synthetic zipf_<skew>_<recency>.tr traces for the cacheck sweep. Fresh requests draw a rank of a bounded Zipf
+# distribution from an alias table, mapped to a key by a seeded permutation. A recency of r mixes in r
+# re-references per fresh request (r / (1 + r) of the requests), each repeating the key requested a
+# geometrically distributed number of requests earlier (--depth on average). The traces are written in the
+# LIRS format, and their keys also straight into the trace cache so that cacheck does not parse them again.
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-o', '--outdir', action='store', default='zipf_traces')
+parser.add_argument('-z', '--zipf', action='store', default='0.6,0.8,1.0,1.2,1.5') # comma separated skews
+parser.add_argument('-r', '--recency', action='store', default='0.0,0.5,1.0') # comma separated re-references per fresh request
+parser.add_argument('-n', '--requests', action='store', type=int, default=10000000)
+parser.add_argument('-k', '--keys', action='store', type=int, default=1000000) # distinct keys of the Zipf distribution
+parser.add_argument('-p', '--depth', action='store', type=int, default=100) # mean distance of a re-reference, in requests
+parser.add_argument('-e', '--seed', action='store', type=int, default=1)
+parser.add_argument('-c', '--cachedir', action='store', default='.tracecache') # trace cache of cacheck, empty to write the LIRS files only
+parser.add_argument('-b', '--blocksize', action='store', type=int, default=1 << 22) # requests generated at a time
+args = parser.parse_args()
+
+HISTORY_DEPTHS = 20 # re-references reach back at most this many times --depth requests
+
+
+# Walker/Vose alias table: a rank is drawn with one uniform index and one uniform coin
+class ZipfSampler(object):
+    def __init__(self, skew, keys):
+        weights = 1.0 / np.arange(1, keys + 1) ** skew
+        scaled = (weights * keys / weights.sum()).tolist()
+        prob = [1.0] * keys
+        alias = list(range(keys))
+        small = [i for i in range(keys) if scaled[i] < 1.0]
+        large = [i for i in range(keys) if scaled[i] >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            prob[s] = scaled[s]
+            alias[s] = l
+            scaled[l] += scaled[s] - 1.0
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+        self.prob = np.array(prob)
+        self.alias = np.array(alias, dtype=np.int64)
+
+    def sample(self, rng, n):
+        ranks = rng.integers(len(self.prob), size=n)
+        return np.where(rng.random(n) < self.prob[ranks], ranks, self.alias[ranks])
+
+
+# Replaces the re-referencing requests of a block by the keys they repeat. history holds the keys requested
+# before the block; chains of re-references are followed by pointer jumping until every request points at a
+# fresh request or at the history.
+def add_recency(rng, fresh, history, recency, depth):
+    n = len(fresh)
+    if recency <= 0 or n == 0:
+        return fresh
+    keys = np.concatenate([history, fresh])
+    positions = np.arange(len(history), len(keys))
+    reuse = rng.random(n) < recency / (1 + recency)
+    sources = positions - np.minimum(rng.geometric(1.0 / depth, size=n), HISTORY_DEPTHS * depth)
+    sources = np.where(reuse & (sources >= 0), sources, positions)
+    pointers = np.arange(len(keys))
+    pointers[len(history):] = sources
+    while True:
+        jumped = pointers[pointers]
+        if np.array_equal(jumped, pointers):
+            break
+        pointers = jumped
+    return keys[pointers[len(history):]]
+
+
+def generate(skew, recency, requests, keys, depth, seed, block_size):
+    rng = np.random.default_rng([seed, round(skew * 1000), round(recency * 1000)])
+    sampler = ZipfSampler(skew, keys)
+    permutation = rng.permutation(keys).astype(np.int64)
+    history = np.empty(0, dtype=np.int64)
+    for start in range(0, requests, block_size):
+        block = add_recency(rng, permutation[sampler.sample(rng, min(block_size, requests - start))], history, recency, depth)
+        history = np.concatenate([history, block])[-HISTORY_DEPTHS * depth:]
+        yield block
+
+
+# One key per line, formatted with numpy: the digits of every key are laid out in a fixed-width matrix and
+# the leading zeros are dropped
+def lirs_bytes(keys):
+    width = len(str(int(keys.max()))) if len(keys) else 1
+    digits = np.empty((len(keys), width + 1), dtype=np.uint8)
+    values = keys.copy()
+    for column in range(width - 1, -1, -1):
+        digits[:, column] = values % 10 + ord('0')
+        values //= 10
+    digits[:, width] = ord('\n')
+    lengths = np.ones(len(keys), dtype=np.int64)
+    for power in range(1, width):
+        lengths += keys >= 10 ** power
+    return digits[np.arange(width + 1) >= (width - lengths)[:, np.newaxis]].tobytes()
+
+
+def write_trace(path, blocks, trace_cache):
+    tmp_suffix = ".{}.tmp".format(os.getpid())
+    keys_path = None
+    keys_file = None
+    if trace_cache is not None:
+        os.makedirs(trace_cache.cache_dir, exist_ok=True)
+        keys_path = os.path.join(trace_cache.cache_dir, os.path.basename(path) + tmp_suffix)
+        keys_file = open(keys_path, 'wb')
+    with open(path + tmp_suffix, 'wb') as f:
+        for block in blocks:
+            f.write(lirs_bytes(block))
+            if keys_file is not None:
+                block.astype('<i8').tofile(keys_file)
+    os.replace(path + tmp_suffix, path)
+    if keys_file is not None:
+        keys_file.close()
+        trace_cache.publish_keys(path, LirsParser, keys_path)
+
+
+def main():
+    os.makedirs(args.outdir, exist_ok=True)
+    trace_cache = TraceCache(args.cachedir) if args.cachedir else None
+    for skew in args.zipf.split(','):
+        for recency in args.recency.split(','):
+            path = os.path.join(args.outdir, "zipf_{}_{}.tr".format(skew, recency))
+            write_trace(path, generate(float(skew), float(recency), args.requests, args.keys, args.depth, args.seed, args.blocksize), trace_cache)
+            print(path)
+
+
+if __name__ == "__main__":
+    main()
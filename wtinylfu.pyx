@@ -0,0 +1,329 @@
+from libc.stdint cimport int64_t
+from libc.string cimport memset
+from cpython.mem cimport PyMem_Malloc, PyMem_Free
+from cms cimport CMS
+
+# W-TinyLFU as in policies.py (LRU window, SLRU main with probation/protected segments, CMS admission between
+# the window candidate and the probation victim), compiled and plugging into cacheck.run() like LRU/LFU.
+# The three segments are circular doubly linked lists over preallocated slot arrays: slots 0, 1 and 2 are the
+# window, probation and protected sentinels, resident keys use the slots above them.
+# Resident keys are found through a dict, or with dense key ids (tracecache) through a flat id -> slot array
+# (0 when not resident); the sketch and the indicator always see the original keys, so both give the same results.
+
+cdef enum:
+    WINDOW = 0
+    PROBATION = 1
+    PROTECTED = 2
+    FIRST_SLOT = 3
+
+
+cdef class WTinyLFU:
+    cdef public long maximum_size
+    cdef public long hits, misses
+    cdef public long window_percentage
+    cdef public long max_window_size, max_protected, size_window, size_protected
+    cdef int* prev_slot
+    cdef int* next_slot
+    cdef int64_t* key_slot
+    cdef unsigned char* status_slot
+    cdef int free_head, unused
+    cdef public long resident
+    cdef dict data
+    cdef int* key_index
+    cdef const int64_t[:] unique_keys
+    cdef CMS cms
+
+    def __init__(self, maximum_size, window_percentage=1):
+        self.maximum_size = maximum_size
+        self.window_percentage = window_percentage
+        self.prev_slot = <int*>PyMem_Malloc((maximum_size + 1 + FIRST_SLOT) * sizeof(int))
+        self.next_slot = <int*>PyMem_Malloc((maximum_size + 1 + FIRST_SLOT) * sizeof(int))
+        self.key_slot = <int64_t*>PyMem_Malloc((maximum_size + 1 + FIRST_SLOT) * sizeof(int64_t))
+        self.status_slot = <unsigned char*>PyMem_Malloc((maximum_size + 1 + FIRST_SLOT) * sizeof(unsigned char))
+        if not self.prev_slot or not self.next_slot or not self.key_slot or not self.status_slot:
+            raise MemoryError()
+        self.reset()
+
+    def __dealloc__(self):
+        PyMem_Free(self.key_index)
+        PyMem_Free(self.prev_slot)
+        PyMem_Free(self.next_slot)
+        PyMem_Free(self.key_slot)
+        PyMem_Free(self.status_slot)
+
+    def __reduce__(self):
+        return (self.__class__, (self.maximum_size, self.window_percentage))
+
+    def reset(self):
+        cdef int sentinel
+        self.hits = 0
+        self.misses = 0
+        self.data = {}
+        self.resident = 0
+        if self.key_index != NULL:
+            memset(self.key_index, 0, len(self.unique_keys) * sizeof(int))
+        self.cms = CMS(self.maximum_size)
+        for sentinel in range(FIRST_SLOT):
+            self.prev_slot[sentinel] = sentinel
+            self.next_slot[sentinel] = sentinel
+        self.free_head = -1
+        self.unused = FIRST_SLOT
+        self.max_window_size = (self.maximum_size * self.window_percentage) // 100
+        self.max_protected = (self.maximum_size - self.max_window_size) * 4 // 5
+        self.size_window = 0
+        self.size_protected = 0
+
+    def record(self, key, size=1):
+        return self.access(key)
+
+    def record_many(self, keys, sizes=None):
+        for key in keys.tolist():
+            self.access(key)
+
+    def get_stats(self):
+        return {'name' : self.get_name(), 'size' : self.maximum_size, 'hits' : self.hits, 'misses' : self.misses, 'hit ratio' : self.hits / max(1, self.hits + self.misses) }
+
+    def get_name(self):
+        return self.__class__.__name__
+
+    def get_params(self):
+        return {'maximum_size' : self.maximum_size, 'window_percentage' : self.window_percentage}
+
+    def resized(self, maximum_size):
+        return self.__class__(maximum_size, self.window_percentage)
+
+    def __len__(self):
+        return self.resident
+
+    def use_dense_keys(self, unique_keys):
+        PyMem_Free(self.key_index)
+        self.key_index = <int*>PyMem_Malloc(max(1, len(unique_keys)) * sizeof(int))
+        if not self.key_index:
+            raise MemoryError()
+        self.unique_keys = unique_keys
+        memset(self.key_index, 0, len(unique_keys) * sizeof(int))
+
+    cdef inline int64_t original_key(self, int64_t key):
+        if self.key_index != NULL:
+            return self.unique_keys[key]
+        return key
+
+    cdef inline void unlink(self, int slot):
+        self.next_slot[self.prev_slot[slot]] = self.next_slot[slot]
+        self.prev_slot[self.next_slot[slot]] = self.prev_slot[slot]
+
+    cdef inline void append_to_tail(self, int slot, int sentinel):
+        self.prev_slot[slot] = self.prev_slot[sentinel]
+        self.next_slot[slot] = sentinel
+        self.next_slot[self.prev_slot[slot]] = slot
+        self.prev_slot[sentinel] = slot
+        self.status_slot[slot] = sentinel
+
+    cdef inline void append_to_head(self, int slot, int sentinel):
+        self.next_slot[slot] = self.next_slot[sentinel]
+        self.prev_slot[slot] = sentinel
+        self.prev_slot[self.next_slot[slot]] = slot
+        self.next_slot[sentinel] = slot
+        self.status_slot[slot] = sentinel
+
+    cdef bint access(self, key) except? -1:
+        cdef int slot
+        cdef int64_t e = key
+        self.cms.add(<unsigned long>self.original_key(e))
+        if self.key_index != NULL:
+            slot = self.key_index[e]
+        else:
+            found = self.data.get(key)
+            slot = 0 if found is None else found
+        if slot == 0:
+            self.misses += 1
+            if self.free_head >= 0:
+                slot = self.free_head
+                self.free_head = self.next_slot[slot]
+            else:
+                slot = self.unused
+                self.unused += 1
+            self.key_slot[slot] = e
+            self.append_to_tail(slot, WINDOW)
+            if self.key_index != NULL:
+                self.key_index[e] = slot
+            else:
+                self.data[key] = slot
+            self.resident += 1
+            self.size_window += 1
+            if self.size_window > self.max_window_size:
+                self.evict()
+            return False
+        self.hits += 1
+        self.unlink(slot)
+        if self.status_slot[slot] == WINDOW:
+            self.append_to_tail(slot, WINDOW)
+        elif self.status_slot[slot] == PROBATION:
+            self.append_to_tail(slot, PROTECTED)
+            self.size_protected += 1
+            self.demote_protected()
+        else:
+            self.append_to_tail(slot, PROTECTED)
+        return True
+
+    cdef void demote_protected(self):
+        cdef int demote
+        if self.size_protected > self.max_protected:
+            demote = self.next_slot[PROTECTED]
+            self.unlink(demote)
+            self.append_to_tail(demote, PROBATION)
+            self.size_protected -= 1
+
+    cdef int evict(self) except -1:
+        cdef int candidate = self.next_slot[WINDOW]
+        cdef int victim, evicted
+        self.unlink(candidate)
+        self.size_window -= 1
+        self.append_to_tail(candidate, PROBATION)
+        if self.resident > self.maximum_size:
+            victim = self.next_slot[PROBATION]
+            if self.cms.estimate(<unsigned long>self.original_key(self.key_slot[candidate])) > self.cms.estimate(<unsigned long>self.original_key(self.key_slot[victim])):
+                evicted = victim
+            else:
+                evicted = candidate
+            if self.key_index != NULL:
+                self.key_index[self.key_slot[evicted]] = 0
+            else:
+                del self.data[self.key_slot[evicted]]
+            self.resident -= 1
+            self.unlink(evicted)
+            self.next_slot[evicted] = self.free_head
+            self.free_head = evicted
+        return 0
+
+    # Window resizing used by the adaptive variants (AdaptiveWTinyLFU in policies.py)
+    def adjust(self, long wanted_window):
+        if self.resident < self.maximum_size:
+            return
+        if wanted_window > self.max_window_size:
+            self.increase_window(wanted_window - self.max_window_size)
+        elif wanted_window < self.max_window_size:
+            self.decrease_window(self.max_window_size - wanted_window)
+
+    cpdef increase_window(self, long amount):
+        cdef long step
+        cdef int candidate
+        for step in range(min(amount, self.max_protected)):
+            self.max_window_size += 1
+            self.max_protected -= 1
+            self.demote_protected()
+            candidate = self.next_slot[PROBATION]
+            if candidate == PROBATION:
+                continue
+            self.unlink(candidate)
+            self.append_to_tail(candidate, WINDOW)
+            self.size_window += 1
+
+    cpdef decrease_window(self, long amount):
+        cdef long step
+        cdef int candidate
+        for step in range(min(amount, self.max_window_size)):
+            self.max_window_size -= 1
+            self.max_protected += 1
+            candidate = self.next_slot[WINDOW]
+            if candidate == WINDOW:
+                continue
+            self.unlink(candidate)
+            self.append_to_head(candidate, PROBATION)
+            self.size_window -= 1
+
+
+# Hill Climbing aprroach
+cdef class WC_WTinyLFU(WTinyLFU):
+    cdef public long hits_in_sample, hits_in_prev, sample, sample_size, pivot
+    cdef public long sample_multiplier
+    cdef public double pivot_fraction
+    cdef public bint increase_direction
+
+    def __init__(self, maximum_size, window_percentage=1, sample_multiplier=10, pivot=0.05):
+        self.sample_multiplier = sample_multiplier
+        self.pivot_fraction = pivot
+        super().__init__(maximum_size, window_percentage)
+
+    def __reduce__(self):
+        return (self.__class__, (self.maximum_size, self.window_percentage, self.sample_multiplier, self.pivot_fraction))
+
+    def resized(self, maximum_size):
+        return self.__class__(maximum_size, self.window_percentage, self.sample_multiplier, self.pivot_fraction)
+
+    def get_params(self):
+        params = super().get_params()
+        params.update(sample_multiplier=self.sample_multiplier, pivot=self.pivot_fraction)
+        return params
+
+    def reset(self):
+        super().reset()
+        self.hits_in_sample = 0
+        self.hits_in_prev = 0
+        self.sample = 0
+        self.sample_size = self.sample_multiplier * self.maximum_size
+        self.pivot = int(self.pivot_fraction * self.maximum_size)
+        self.increase_direction = False
+
+    def record(self, key, size=1):
+        cdef bint hit = self.access(key)
+        if self.resident >= self.maximum_size:
+            self.climb(hit)
+        return hit
+
+    def record_many(self, keys, sizes=None):
+        cdef bint hit
+        for key in keys.tolist():
+            hit = self.access(key)
+            if self.resident >= self.maximum_size:
+                self.climb(hit)
+
+    cdef void climb(self, bint hit):
+        if hit:
+            self.hits_in_sample += 1
+        self.sample += 1
+        if self.sample >= self.sample_size:
+            if self.hits_in_prev > 0:
+                if (self.hits_in_prev + self.sample * 0.01) > self.hits_in_sample:
+                    self.increase_direction = not self.increase_direction
+                if self.increase_direction:
+                    self.increase_window(self.pivot)
+                else:
+                    self.decrease_window(self.pivot)
+            self.hits_in_prev = self.hits_in_sample
+            self.hits_in_sample = 0
+            self.sample = 0
+
+
+# Indicator approach, the skew/hint estimation stays in python (policies.Indicator)
+cdef class WI_WTinyLFU(WTinyLFU):
+    cdef public long sample, sample_size
+    cdef public object indicator
+
+    def reset(self):
+        from policies import Indicator
+        super().reset()
+        self.sample = 0
+        self.sample_size = 50000
+        self.indicator = Indicator()
+
+    def record(self, key, size=1):
+        cdef bint hit = self.access(key)
+        if self.resident >= self.maximum_size:
+            self.climb(key)
+        return hit
+
+    def record_many(self, keys, sizes=None):
+        for key in keys.tolist():
+            self.access(key)
+            if self.resident >= self.maximum_size:
+                self.climb(key)
+
+    cdef void climb(self, key) except *:
+        self.indicator.record(self.original_key(key))
+        self.sample += 1
+        if self.sample >= self.sample_size:
+            ind = self.indicator.get_indicator()*80.0/100.0
+            self.adjust(int(ind*self.maximum_size))
+            self.indicator.reset()
+            self.sample = 0